@@ -24,4 +24,6 @@ async def get_round_details(request, round_id):
     result = await db.rounds.get_round_details(round_id)
     if result is None:
         abort(404)
+    # games store the raw ANSI, older rounds already have html
+    result["snapshot"] = db.snapshots.render_snapshot(result["snapshot"])
     return json(result, dumps=serialize)
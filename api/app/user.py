@@ -69,3 +69,13 @@ async def retrieve_play_token(request):
     password = request.form.get("password")
     user = await get_user_from_creds(username, password)
     return text(user["play_token"])
+
+
+@bp.route("/refresh_play_token", methods=["POST"])
+@throttle(max_per_minute=2, prefix="refresh_play_token")
+async def refresh_play_token(request):
+    username = request.form.get("username")
+    password = request.form.get("password")
+    user = await get_user_from_creds(username, password)
+    user = await db.users.refresh_play_token(user["username"], request.app.redis)
+    return text(user["play_token"])
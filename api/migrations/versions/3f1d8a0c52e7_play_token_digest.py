@@ -0,0 +1,70 @@
+"""store a sha256 digest of play tokens with a unique index
+
+Revision ID: 3f1d8a0c52e7
+Revises: 6c702c2a9e2a
+Create Date: 2020-05-02 18:41:09.514722
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1d8a0c52e7'
+down_revision = '6c702c2a9e2a'
+branch_labels = None
+depends_on = None
+
+
+BACKFILL_BATCH_SIZE = 10000
+
+backfill = (
+    "UPDATE users "
+    "SET play_token_digest = encode(sha256(convert_to(play_token, 'UTF8')), 'hex') "
+    "WHERE play_token_digest IS NULL"
+)
+
+backfill_batch = (
+    f"{backfill} AND id IN ("
+    "SELECT id FROM users WHERE play_token_digest IS NULL "
+    f"LIMIT {BACKFILL_BATCH_SIZE}"
+    ")"
+)
+
+
+def backfill_digests():
+    if context.is_offline_mode():
+        # no row counts when generating sql, so no batching either
+        op.execute(backfill)
+        return
+    bind = op.get_bind()
+    while bind.execute(sa.text(backfill_batch)).rowcount:
+        pass
+
+
+def upgrade():
+    # adding a nullable column without a default doesn't rewrite the table
+    op.add_column('users', sa.Column('play_token_digest', sa.String(length=64), nullable=True))
+
+    # backfill and index outside of the migration transaction so each
+    # batch commits on its own and the index is built without locking
+    # out writes (CREATE INDEX CONCURRENTLY can't run in a transaction)
+    with op.get_context().autocommit_block():
+        backfill_digests()
+        op.create_index(
+            op.f('ix_users_play_token_digest'),
+            'users',
+            ['play_token_digest'],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            op.f('ix_users_play_token_digest'),
+            table_name='users',
+            postgresql_concurrently=True,
+        )
+    op.drop_column('users', 'play_token_digest')
@@ -0,0 +1,117 @@
+"""drop rounds.snapshot now that every games server writes snapshot_hash
+
+Contract step of 9e4b7c2d1a68, only run it once no games server older
+than the snapshots table is left.
+
+Revision ID: 5b8e0f3c7d21
+Revises: 9e4b7c2d1a68
+Create Date: 2020-05-16 10:03:52.640118
+
+"""
+import hashlib
+import zlib
+from alembic import context, op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e0f3c7d21'
+down_revision = '9e4b7c2d1a68'
+branch_labels = None
+depends_on = None
+
+
+BACKFILL_BATCH_SIZE = 1000
+
+snapshots = sa.table(
+    'snapshots',
+    sa.column('hash', sa.String),
+    sa.column('data', sa.LargeBinary),
+)
+
+# written by old games servers after 9e4b7c2d1a68 backfilled
+select_snapshots_batch = sa.text(
+    "SELECT id, snapshot FROM rounds "
+    "WHERE id > :last_id AND snapshot IS NOT NULL AND snapshot_hash IS NULL "
+    "ORDER BY id LIMIT :limit"
+)
+
+select_hashes_batch = sa.text(
+    "SELECT rounds.id, snapshots.data FROM rounds "
+    "JOIN snapshots ON snapshots.hash = rounds.snapshot_hash "
+    "WHERE rounds.id > :last_id "
+    "ORDER BY rounds.id LIMIT :limit"
+)
+
+
+def batches(bind, query):
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            query, last_id=last_id, limit=BACKFILL_BATCH_SIZE
+        ).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def require_online_mode():
+    if context.is_offline_mode():
+        # postgres can't zlib, the backfill has to happen here
+        raise RuntimeError("snapshots are (de)compressed in python, run this online")
+
+
+def backfill_snapshots():
+    # same as termninja_db.snapshots.pack_snapshot
+    bind = op.get_bind()
+    for rows in batches(bind, select_snapshots_batch):
+        packed = {}
+        updates = []
+        for round_id, snapshot in rows:
+            raw = snapshot.encode()
+            key = hashlib.sha256(raw).hexdigest()
+            packed[key] = raw
+            updates.append({'round_id': round_id, 'hash': key})
+        bind.execute(
+            postgresql.insert(snapshots)
+            .values([
+                {'hash': key, 'data': zlib.compress(packed[key])}
+                for key in sorted(packed)
+            ])
+            .on_conflict_do_nothing(index_elements=['hash'])
+        )
+        bind.execute(
+            sa.text("UPDATE rounds SET snapshot_hash = :hash WHERE id = :round_id"),
+            updates,
+        )
+
+
+def restore_snapshots():
+    bind = op.get_bind()
+    for rows in batches(bind, select_hashes_batch):
+        bind.execute(
+            sa.text("UPDATE rounds SET snapshot = :snapshot WHERE id = :round_id"),
+            [
+                {'round_id': round_id, 'snapshot': zlib.decompress(data).decode()}
+                for round_id, data in rows
+            ],
+        )
+
+
+def upgrade():
+    require_online_mode()
+    with op.get_context().autocommit_block():
+        backfill_snapshots()
+
+    # postgres only hides the column, the space comes back as rows are
+    # rewritten (or with a VACUUM FULL)
+    op.drop_column('rounds', 'snapshot')
+
+
+def downgrade():
+    require_online_mode()
+    op.add_column('rounds', sa.Column('snapshot', sa.Text(), nullable=True))
+    with op.get_context().autocommit_block():
+        restore_snapshots()
@@ -0,0 +1,129 @@
+"""move round snapshots to a compressed, content addressed table
+
+Expand step: rounds.snapshot is kept for games servers that still write
+it while the new ones roll out, 5b8e0f3c7d21 drops it once none do.
+
+Revision ID: 9e4b7c2d1a68
+Revises: 3f1d8a0c52e7
+Create Date: 2020-05-09 14:12:37.208311
+
+"""
+import hashlib
+import zlib
+from alembic import context, op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4b7c2d1a68'
+down_revision = '3f1d8a0c52e7'
+branch_labels = None
+depends_on = None
+
+
+BACKFILL_BATCH_SIZE = 1000
+
+snapshots = sa.table(
+    'snapshots',
+    sa.column('hash', sa.String),
+    sa.column('data', sa.LargeBinary),
+)
+
+# batches walk the primary key instead of filtering on what's left, so
+# each one doesn't scan past the rows already done
+select_snapshots_batch = sa.text(
+    "SELECT id, snapshot FROM rounds "
+    "WHERE id > :last_id AND snapshot IS NOT NULL "
+    "ORDER BY id LIMIT :limit"
+)
+
+# rounds written by the new code only have a snapshot_hash
+select_hashes_batch = sa.text(
+    "SELECT rounds.id, snapshots.data FROM rounds "
+    "JOIN snapshots ON snapshots.hash = rounds.snapshot_hash "
+    "WHERE rounds.id > :last_id AND rounds.snapshot IS NULL "
+    "ORDER BY rounds.id LIMIT :limit"
+)
+
+
+def batches(bind, query):
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            query, last_id=last_id, limit=BACKFILL_BATCH_SIZE
+        ).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def require_online_mode():
+    if context.is_offline_mode():
+        # postgres can't zlib, the backfill has to happen here
+        raise RuntimeError("snapshots are (de)compressed in python, run this online")
+
+
+def backfill_snapshots():
+    # same as termninja_db.snapshots.pack_snapshot
+    bind = op.get_bind()
+    for rows in batches(bind, select_snapshots_batch):
+        packed = {}
+        updates = []
+        for round_id, snapshot in rows:
+            raw = snapshot.encode()
+            key = hashlib.sha256(raw).hexdigest()
+            packed[key] = raw
+            updates.append({'round_id': round_id, 'hash': key})
+        bind.execute(
+            postgresql.insert(snapshots)
+            .values([
+                {'hash': key, 'data': zlib.compress(packed[key])}
+                for key in sorted(packed)
+            ])
+            .on_conflict_do_nothing(index_elements=['hash'])
+        )
+        bind.execute(
+            sa.text("UPDATE rounds SET snapshot_hash = :hash WHERE id = :round_id"),
+            updates,
+        )
+
+
+def restore_snapshots():
+    bind = op.get_bind()
+    for rows in batches(bind, select_hashes_batch):
+        bind.execute(
+            sa.text("UPDATE rounds SET snapshot = :snapshot WHERE id = :round_id"),
+            [
+                {'round_id': round_id, 'snapshot': zlib.decompress(data).decode()}
+                for round_id, data in rows
+            ],
+        )
+
+
+def upgrade():
+    require_online_mode()
+    op.create_table('snapshots',
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    op.add_column('rounds', sa.Column('snapshot_hash', sa.String(length=64), nullable=True))
+    op.create_foreign_key(
+        op.f('rounds_snapshot_hash_fkey'),
+        'rounds', 'snapshots', ['snapshot_hash'], ['hash'],
+    )
+
+    # each batch commits on its own, rounds keep being played meanwhile
+    with op.get_context().autocommit_block():
+        backfill_snapshots()
+
+
+def downgrade():
+    require_online_mode()
+    with op.get_context().autocommit_block():
+        restore_snapshots()
+    op.drop_constraint(op.f('rounds_snapshot_hash_fkey'), 'rounds', type_='foreignkey')
+    op.drop_column('rounds', 'snapshot_hash')
+    op.drop_table('snapshots')
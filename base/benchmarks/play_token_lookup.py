@@ -0,0 +1,101 @@
+"""
+Play token lookup latency with and without the digest index.
+
+Seeds a scratch copy of the users table with --users rows, then times
+looking up random tokens the old way (sequential scan on play_token) and
+the new way (unique index on play_token_digest). Needs the same
+POSTGRES_* environment as the api, e.g.
+
+    docker-compose run --rm api python /base/benchmarks/play_token_lookup.py
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from termninja_db import conn
+from termninja_db.users import make_token_digest
+
+
+TABLE = "bench_play_token_users"
+
+CREATE = [
+    f"DROP TABLE IF EXISTS {TABLE}",
+    f"CREATE TABLE {TABLE} (LIKE users INCLUDING DEFAULTS)",
+]
+
+SEED = f"""
+    INSERT INTO {TABLE}
+        (id, username, password_hash, play_token, play_token_expires_at)
+    SELECT i, 'user' || i, '', md5(i::text)::uuid::text, now()
+    FROM generate_series(1, :count) AS i
+"""
+
+INDEX = [
+    f"""
+    UPDATE {TABLE}
+    SET play_token_digest = encode(sha256(convert_to(play_token, 'UTF8')), 'hex')
+    """,
+    f"CREATE UNIQUE INDEX ON {TABLE} (play_token_digest)",
+    f"ANALYZE {TABLE}",
+]
+
+BY_TOKEN = f"SELECT id FROM {TABLE} WHERE play_token = :token"
+BY_DIGEST = f"SELECT id FROM {TABLE} WHERE play_token_digest = :digest"
+
+
+async def time_lookups(query, values):
+    timings = []
+    for value in values:
+        start = time.perf_counter()
+        await conn.fetch_one(query=query, values=value)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label, timings):
+    timings.sort()
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(
+        f"{label:<24} mean {statistics.mean(timings):8.3f} ms  "
+        f"median {statistics.median(timings):8.3f} ms  p99 {p99:8.3f} ms"
+    )
+
+
+async def main(users, lookups):
+    await conn.connect()
+    try:
+        print(f"seeding {users} users...")
+        for statement in CREATE:
+            await conn.execute(query=statement)
+        await conn.execute(query=SEED, values={"count": users})
+        for statement in INDEX:
+            await conn.execute(query=statement)
+
+        rows = await conn.fetch_all(
+            query=f"SELECT play_token FROM {TABLE} WHERE id = ANY(:ids)",
+            values={"ids": random.sample(range(1, users + 1), lookups)},
+        )
+        tokens = [r["play_token"] for r in rows]
+
+        report(
+            "play_token (seq scan)",
+            await time_lookups(BY_TOKEN, [{"token": t} for t in tokens]),
+        )
+        report(
+            "play_token_digest",
+            await time_lookups(
+                BY_DIGEST, [{"digest": make_token_digest(t)} for t in tokens]
+            ),
+        )
+    finally:
+        await conn.execute(query=f"DROP TABLE IF EXISTS {TABLE}")
+        await conn.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.lookups))
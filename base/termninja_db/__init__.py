@@ -1,6 +1,6 @@
 from .conn import conn, metadata, DATABASE_URL
 
-from . import users, games, rounds, tables
+from . import users, games, rounds, snapshots, tables
 
 __all__ = ['conn', 'metadata', 'DATABASE_URL', 'users',
-           'games', 'rounds', 'tables']
+           'games', 'rounds', 'snapshots', 'tables']
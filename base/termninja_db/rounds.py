@@ -1,7 +1,9 @@
 import datetime
 from sqlalchemy import insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from .conn import conn
-from .tables import rounds_table, games_table, users_table
+from .snapshots import pack_snapshot, unpack_snapshot
+from .tables import rounds_table, games_table, users_table, snapshots_table
 
 
 PAGE_SIZE = 10
@@ -18,30 +20,78 @@ list_columns = [
     users_table.c.gravatar_hash,
 ]
 
-detail_columns = list_columns + [rounds_table.c.snapshot]
+detail_columns = list_columns + [snapshots_table.c.data.label("snapshot")]
 
 select_from_default = rounds_table.join(games_table).outerjoin(
     users_table
 )  # noqa: E127
 
+select_from_detail = select_from_default.outerjoin(snapshots_table)
+
 
 async def add_round_played(slug, username, score, **kwargs):
-    insert_query = insert(rounds_table)
-    values = {
-        "game_slug": slug,
-        "user_username": username,
-        "score": score,
-        "played_at": datetime.datetime.now(),
-        **kwargs,
-    }
-    await conn.execute(query=insert_query, values=values)
-    if username:
-        update_query = (
-            update(users_table)
-            .where(users_table.c.username == username)
-            .values(total_score=users_table.c.total_score + score)
-        )
-        await conn.execute(query=update_query)
+    await add_rounds_played(
+        [
+            {
+                "game_slug": slug,
+                "user_username": username,
+                "score": score,
+                "played_at": datetime.datetime.now(),
+                **kwargs,
+            }
+        ]
+    )
+
+
+async def add_rounds_played(rounds):
+    """
+    Store a batch of rounds in one transaction: a single multi-row
+    insert and one total_score update per user. Every round needs the
+    same keys, game_slug, user_username, score, played_at and
+    optionally message and snapshot.
+    """
+    if not rounds:
+        return
+    scores = {}
+    snapshots = {}
+    values = []
+    for r in rounds:
+        if r["user_username"]:
+            scores[r["user_username"]] = (
+                scores.get(r["user_username"], 0) + r["score"]
+            )
+        r = dict(r)
+        snapshot = r.pop("snapshot", None)
+        if snapshot is not None:
+            key, data = pack_snapshot(snapshot)
+            snapshots[key] = data
+            r["snapshot_hash"] = key
+        else:
+            r["snapshot_hash"] = None
+        values.append(r)
+    async with conn.transaction():
+        if snapshots:
+            # sorted for the same reason as the score updates
+            snapshot_rows = [
+                {"hash": key, "data": snapshots[key]} for key in sorted(snapshots)
+            ]
+            snapshots_query = (
+                pg_insert(snapshots_table)
+                .values(snapshot_rows)
+                .on_conflict_do_nothing(index_elements=["hash"])
+            )
+            await conn.execute(query=snapshots_query)
+        await conn.execute(query=insert(rounds_table).values(values))
+        # always in the same order so concurrent batches can't deadlock
+        for username in sorted(scores):
+            if not scores[username]:
+                continue
+            update_query = (
+                update(users_table)
+                .where(users_table.c.username == username)
+                .values(total_score=users_table.c.total_score + scores[username])
+            )
+            await conn.execute(query=update_query)
 
 
 async def list_rounds_played(page=0, **filters):
@@ -96,8 +146,12 @@ async def get_round_details(round_id):
     """
     query = (
         select(detail_columns)
-        .select_from(select_from_default)
+        .select_from(select_from_detail)
         .where(rounds_table.c.id == round_id)
     )  # noqa: E127
     result = await conn.fetch_one(query=query)
-    return result and dict(result)
+    if result is None:
+        return None
+    result = dict(result)
+    result["snapshot"] = unpack_snapshot(result["snapshot"])
+    return result
@@ -0,0 +1,208 @@
+"""
+Game snapshots as stored with each round.
+
+Games store the final frame of a round as raw ANSI behind a header line
+with the format version and how to render it:
+
+    TNS1 centered=1 bold=1
+    <ansi>
+
+It is converted to html when it is first looked at. Rounds stored
+before this have the html itself.
+
+Snapshots live in their own table, zlib compressed and keyed by the
+sha256 of their text, so identical snapshots are only stored once and
+rounds only hold the key.
+"""
+import functools
+import hashlib
+import re
+import zlib
+
+
+SNAPSHOT_VERSION = 'TNS1'
+
+ESCAPE = '\x1b['
+RESET = f'{ESCAPE}0m'
+
+color_codes_to_style = {
+    '31': 'red',
+    '32': 'lime',
+    '33': 'yellow',
+    '36': 'cyan',
+    '35': 'magenta'
+}
+
+
+def encode_snapshot(ansi, centered=True, bold=True):
+    return f'{SNAPSHOT_VERSION} centered={centered:d} bold={bold:d}\n{ansi}'
+
+
+def pack_snapshot(snapshot):
+    """
+    (key, compressed data) to store a snapshot
+    """
+    raw = snapshot.encode()
+    return hashlib.sha256(raw).hexdigest(), zlib.compress(raw)
+
+
+def unpack_snapshot(data):
+    return data and zlib.decompress(data).decode()
+
+
+@functools.lru_cache(maxsize=1024)
+def render_snapshot(snapshot):
+    """
+    html for a stored snapshot, rounds never change so renders are cached
+    """
+    if snapshot is None or not snapshot.startswith(f'{SNAPSHOT_VERSION} '):
+        return snapshot  # already html
+    header, _, ansi = snapshot.partition('\n')
+    options = dict(
+        field.split('=', 1) for field in header.split()[1:] if '=' in field
+    )
+    return ansi_to_html(
+        ansi,
+        centered=options.get('centered', '1') == '1',
+        bold=options.get('bold', '1') == '1',
+    )
+
+
+def get_color_for(color_code):
+    return color_codes_to_style.get(color_code, '')
+
+
+# how text is written into the html. Besides escaping, control characters
+# are replaced the way html sanitizers do (bleach.clean used to produce
+# the snapshot html), except for whitespace at either end of a text node
+TEXT_TRANSLATION = {
+    **{c: '?' for c in range(0x20) if chr(c) not in '\t\n\r'},
+    ord('&'): '&amp;',
+    ord('<'): '&lt;',
+    ord('>'): '&gt;',
+}
+HTML_WHITESPACE = '\t\n\x0c '
+SEQUENCE_TERMINATORS = frozenset('msuJKHABG')
+# newlines, RESET, well formed sequences, anything else starting with
+# an escape sequence (see _read_sequence) and lone escape characters
+TOKEN_RE = re.compile('\n|\x1b\\[0m|\x1b\\[([0-9;]*)([msuJKHABG])|\x1b\\[?')
+
+
+def make_span(color_code):
+    color = get_color_for(color_code)
+    style = f'color: {color};' if color else ''
+    return f'<span style="{style}">'
+
+
+def ansi_to_html(ansi, centered=True, bold=True):
+    """
+    Convert a snapshot to html in one pass. Text is escaped, newlines
+    become <br>, color sequences open a <span> and RESET closes the
+    innermost one, any other escape sequence is dropped. Unclosed spans
+    are closed at the end, so only balanced span/br/pre markup comes out.
+
+    The output is the same as the regex + bleach.clean converter this
+    replaced (see games/benchmarks/ansi_to_html.py), except that text is never
+    read as markup: '&' is always escaped where bleach kept anything that
+    looked like an entity.
+    """
+    classes = 'text-center' if centered else ''
+    classes += ' font-weight-bold' if bold else ''
+    out = [f'<pre class="{classes}">']
+    text = []  # the text node being read
+    open_spans = 0
+    idx = 0
+    end = len(ansi)
+
+    while idx < end:
+        match = TOKEN_RE.search(ansi, idx)
+        if match is None:
+            text.append(ansi[idx:])
+            break
+        start = match.start()
+        if start > idx:
+            text.append(ansi[idx:start])
+        idx = match.end()
+
+        token = match.group()
+        if token == '\n':
+            _write_text(text, out)
+            out.append('<br>')
+            continue
+        if token == RESET:
+            if open_spans:
+                _write_text(text, out)
+                out.append('</span>')
+                open_spans -= 1
+            continue
+        if token == '\x1b':
+            text.append(token)  # not a sequence, written as ?
+            continue
+
+        if token == ESCAPE:
+            idx, color_code = _read_sequence(ansi, start, text)
+        else:
+            parameters, terminator = match.groups()
+            color_code = parameters.split(';')[0] if terminator == 'm' else None
+        if color_code is not None:
+            _write_text(text, out)
+            out.append(make_span(color_code))
+            open_spans += 1
+
+    _write_text(text, out)
+    out.append('</span>' * open_spans)
+    out.append('</pre>')
+    return ''.join(out)
+
+
+def _write_text(text, out):
+    if not text:
+        return
+    data = ''.join(text).replace('\0', '').replace('\r', '\n')
+    text.clear()
+    if len(out) == 1 and data.startswith('\n'):
+        # a newline right after <pre> isn't rendered
+        data = data[1:]
+    middle = data.strip(HTML_WHITESPACE)
+    if middle == data:
+        out.append(data.translate(TEXT_TRANSLATION))
+        return
+    left = data[:len(data) - len(data.lstrip(HTML_WHITESPACE))]
+    right = data[len(left) + len(middle):]
+    out.append(left)
+    out.append(middle.translate(TEXT_TRANSLATION))
+    out.append(right)
+
+
+def _read_sequence(ansi, start, text):
+    """
+    Read the escape sequence at start, returns the index after it and
+    its color code if it sets a color.
+
+    A sequence runs to the first terminator character. For compatibility
+    with the snapshots already stored, it is read the way the old regex
+    based converter saw it, with newlines written as <br/> and RESETs as
+    </span> (where the s of span is a terminator).
+    """
+    sequence = []
+    idx = start + len(ESCAPE)
+    end = len(ansi)
+    while idx < end:
+        char = ansi[idx]
+        if char == '\n':
+            sequence.append('<br/>')
+            idx += 1
+        elif ansi.startswith(RESET, idx):
+            text.append('pan>')
+            return idx + len(RESET), None
+        elif char in SEQUENCE_TERMINATORS:
+            if char != 'm':
+                # it's something other than a color
+                return idx + 1, None
+            return idx + 1, ''.join(sequence).split(';')[0]
+        else:
+            sequence.append(char)
+            idx += 1
+    # never terminated, it's just text
+    text.append('\x1b')
+    return start + 1, None
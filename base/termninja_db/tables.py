@@ -1,4 +1,13 @@
-from sqlalchemy import Table, Column, String, Text, Integer, DateTime, ForeignKey
+from sqlalchemy import (
+    Table,
+    Column,
+    String,
+    Text,
+    Integer,
+    DateTime,
+    ForeignKey,
+    LargeBinary,
+)
 from .conn import metadata
 
 
@@ -10,6 +19,8 @@ users_table = Table(
     Column("password_hash", String(128), nullable=False),
     Column("gravatar_hash", String(128), nullable=True),
     Column("play_token", String(36), nullable=False),
+    # sha256 hex digest of play_token, what connections are looked up by
+    Column("play_token_digest", String(64), nullable=True, unique=True, index=True),
     Column("play_token_expires_at", DateTime, nullable=False),
     Column("total_score", Integer, server_default="0"),
 )
@@ -36,5 +47,16 @@ rounds_table = Table(
     Column("user_username", ForeignKey("users.username"), nullable=True),
     Column("score", Integer, server_default="0"),
     Column("message", String(128), server_default=""),
-    Column("snapshot", Text, nullable=True, server_default=None),
+    # see termninja_db.snapshots
+    Column("snapshot_hash", ForeignKey("snapshots.hash"), nullable=True),
+)
+
+
+snapshots_table = Table(
+    "snapshots",
+    metadata,
+    # sha256 hex digest of the snapshot text
+    Column("hash", String(64), primary_key=True),
+    # zlib compressed snapshot text
+    Column("data", LargeBinary, nullable=False),
 )
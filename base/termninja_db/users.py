@@ -10,6 +10,10 @@ from .tables import users_table
 
 GLOBAL_LEADERBOARD_SIZE = os.environ.get("TERMNINJA_GLOBAL_LEADERBOARD_SIZE", 25)
 
+# games servers cache users by play token, the username is published
+# here when a token is rotated so the cached entry can be dropped
+PLAY_TOKEN_ROTATED_CHANNEL = "play_token_rotated"
+
 default_columns = [
     users_table.c.id,
     users_table.c.username,
@@ -28,6 +32,10 @@ def make_token():
     return str(uuid4())
 
 
+def make_token_digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
 def make_token_expires_at(days):
     now = datetime.datetime.now()
     return now + datetime.timedelta(days=days)
@@ -49,11 +57,13 @@ async def create_user(username, password):
     """
     Create a user, returns new user_id
     """
+    token = make_token()
     values = {
         "username": username,
         "password_hash": create_password_hash(password),
         "gravatar_hash": create_gravatar_hash(username),
-        "play_token": make_token(),
+        "play_token": token,
+        "play_token_digest": make_token_digest(token),
         "play_token_expires_at": make_token_expires_at(1),
     }
     query = insert(users_table)
@@ -87,23 +97,28 @@ async def select_by_play_token(token):
     Get a user by their play token
     """
     query = select(authenticated_columns).where(
-        users_table.c.play_token == token
+        users_table.c.play_token_digest == make_token_digest(token)
     )  # noqa:E127
     user = await conn.fetch_one(query=query)
     return user and dict(user)
 
 
-async def refresh_play_token(username, days=7):
+async def refresh_play_token(username, redis, days=7):
     """
     Give a user a new play token with more time
         username is expected to exist.
+        the rotation is published on redis so games servers drop the
+        old token from their caches.
     """
     query = update(users_table).where(users_table.c.username == username)  # noqa:E127
+    token = make_token()
     values = {
-        "play_token": make_token(),
+        "play_token": token,
+        "play_token_digest": make_token_digest(token),
         "play_token_expires_at": make_token_expires_at(days=days),
     }
     await conn.execute(query=query, values=values)
+    await redis.publish(PLAY_TOKEN_ROTATED_CHANNEL, username)
     return await select_by_username(username, authenticated=True)
 
 
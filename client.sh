@@ -10,13 +10,14 @@ register=false
 unencrypted=true
 realtime=false
 anonymous=false
+no_emoji=false
 debug_output=false
 
 # command to execute (dynamically generated)
 command=""
 
-# data to send (token and game choice if specified)
-data=""
+# connection preamble, answers the server's prompts up front
+preamble="TNJ1"
 
 if [ "$1" = "--help" ]
 then
@@ -30,13 +31,14 @@ then
   echo -e "\t-r\t\tRegister"
   echo -e "\t-a\t\tplay anonymously"
   echo -e "\t-i\t\twhether to play 'interactively' (e.g. snake game)"
+  echo -e "\t-n\t\tterminal does not support emojis"
   echo -e "\t-u\t\tuse an unencrypted connection (for development)"
   echo -e "\t-d\t\tdebug command - only show the command that will run don't execute\n"
   exit 0;
 fi
 
 
-while getopts ":h:p:t:g:e:auidlr" opt; do
+while getopts ":h:p:t:g:e:auidlrn" opt; do
   case "$opt" in
     h)
       host=${OPTARG}
@@ -65,6 +67,9 @@ while getopts ":h:p:t:g:e:auidlr" opt; do
     i)
       realtime=true
       ;;
+    n)
+      no_emoji=true
+      ;;
     d)
       debug_output=true
       ;;
@@ -178,27 +183,34 @@ fi
 if [ -e ~/.termninja/token.txt ]
 then
   token=$(<~/.termninja/token.txt)
-  data="$token\n\n"
+  preamble="$preamble token=$token"
 fi
 
-# sent empty line if playing anonymously
+# send an empty token if playing anonymously
 if [ $anonymous = true ]
 then
-  data="\n\n"
+  preamble="TNJ1 token="
 fi
 
 # autostart game at gameindex if specified
 if [ -n "$game" ]
 then
-  data="$data$game\n"
+  preamble="$preamble game=$game"
 fi
 
-# pipe any initial data to stdin if appropriate
-if [ -n "$data" ]
+if [ $no_emoji = true ]
 then
-  command="$command (echo -e '$data' && cat ) | "
+  preamble="$preamble emoji=n"
 fi
 
+if [ $realtime = true ]
+then
+  preamble="$preamble realtime=1"
+fi
+
+# send the preamble as the first line, then stdin
+command="$command (echo '$preamble' && cat ) | "
+
 # unencrypted = netcat
 # encrypted = openssl s_client
 if [ $unencrypted = true ]
@@ -13,9 +13,13 @@ app.add_game(Hangman)
 
 if __name__ == "__main__":
     debug = os.environ.get('DEBUG', False)
+    workers = int(os.environ.get('TERMNINJA_WORKERS', 1))
+    loop_policy = os.environ.get('TERMNINJA_LOOP', 'asyncio')
 
     app.start(
         host="0.0.0.0",
         port=3000,
-        debug=debug
+        debug=debug,
+        workers=workers,
+        loop_policy=loop_policy
     )
@@ -0,0 +1,120 @@
+"""
+Check cursor.ansi_to_html produces exactly what the previous regex and
+bleach based converter did on Snake and Hangman snapshots, and compare
+their speed. The previous converter needs bleach (pip install bleach).
+
+Run from the games directory:
+
+    python -m benchmarks.ansi_to_html --snapshots 2000
+"""
+import argparse
+import random
+import re
+import time
+import bleach
+from src import cursor
+from src.player import Player
+from src.games.snake import AsciiBoard, EmojiBoard
+from src.games.hangman import Hangman
+
+
+OPEN_SEQUENCE_RE = re.compile(
+    r'\x1b\[(?P<sequence>.*?)(?P<terminator>[msuJKHABG]{1})'
+)
+
+
+def _make_span(match):
+    if not match.group('terminator') == 'm':
+        return ""
+    color = match.group('sequence').split(';')[0]
+    return f'<span style="color: {cursor.get_color_for(color)}">'
+
+
+def bleach_ansi_to_html(ansi, centered=True, bold=True):
+    """
+    The converter cursor.ansi_to_html replaced
+    """
+    ret = ansi.replace('\n', '<br/>')
+    ret = ret.replace('\x1b[0m', '</span>')
+    html = re.sub(OPEN_SEQUENCE_RE, _make_span, ret)
+    classes = 'text-center' if centered else ''
+    classes += ' font-weight-bold' if bold else ''
+    return bleach.clean(
+        f'<pre class="{classes}">{html}</pre>',
+        tags=['span', 'br', 'pre'],
+        attributes=['style', 'class'],
+        styles=['color', 'background-color', 'padding', 'width']
+    )
+
+
+class _Writer:
+    def write(self, data):
+        pass
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+
+class _Hangman(Hangman):
+    with open(Hangman.wordlist) as f:
+        words = [line.split(" | ")[0] for line in f if " | " in line]
+
+    def get_random_word(self):
+        return random.choice(self.words), ""
+
+
+def snake_snapshot():
+    board = random.choice([AsciiBoard, EmojiBoard])
+    cells = random.sample(sorted(board.ALL_CELLS), random.randint(2, 60))
+    food = (*cells[0], random.choice(board.FOODS))
+    return board.make_snapshot_from_state(cells[1:], food), True, True
+
+
+def hangman_snapshot():
+    game = _Hangman(Player(None, _Writer()))
+    letters = random.sample("abcdefghijklmnopqrstuvwxyz", random.randint(0, 26))
+    for letter in letters:
+        if game.misses == 6 or game.word_complete:
+            break
+        game.guessed_letters.add(letter)
+        if game.is_good_guess(letter):
+            game.update_guess_word(letter)
+        else:
+            game.missed_letters.append(letter)
+    return (
+        game.make_final_snapshot(),
+        Hangman.center_snapshot,
+        Hangman.bold_snapshot,
+    )
+
+
+def timed(convert, corpus):
+    start = time.perf_counter()
+    for snapshot, centered, bold in corpus:
+        convert(snapshot, centered, bold)
+    return (time.perf_counter() - start) / len(corpus) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--snapshots", type=int, default=2000)
+    args = parser.parse_args()
+
+    corpus = [
+        random.choice([snake_snapshot, hangman_snapshot])()
+        for _ in range(args.snapshots)
+    ]
+    for snapshot, centered, bold in corpus:
+        expected = bleach_ansi_to_html(snapshot, centered, bold)
+        actual = cursor.ansi_to_html(snapshot, centered, bold)
+        assert actual == expected, (snapshot, expected, actual)
+    print(f"{len(corpus)} snapshots identical")
+
+    before = timed(bleach_ansi_to_html, corpus)
+    after = timed(cursor.ansi_to_html, corpus)
+    print(f"regex + bleach {before:9.1f} us/snapshot")
+    print(f"single pass    {after:9.1f} us/snapshot  ({before / after:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Load generator for the games server.
+
+Opens many concurrent connections that play real sessions: the token
+prompt (preamble or legacy prompts), the menu, Snake keystrokes, Subnet
+Racer answers and Hangman guesses. Each client reconnects when its game
+ends until the run is over, then latency percentiles are reported.
+
+Run from the games directory against a local server:
+
+    python -m benchmarks.loadgen --host localhost --port 3333 --clients 2000
+
+or against the docker-compose stack, with its own postgres and redis:
+
+    docker-compose -f docker-compose.yml -f docker-compose.loadtest.yml up
+
+Thousands of clients need a raised open files limit (ulimit -n).
+"""
+import argparse
+import asyncio
+import ipaddress
+import random
+import re
+import time
+from collections import Counter
+from src.games.subnet_racer import PROMPTS, QuestionPool
+from src.games.snake import Snake
+
+
+ANSI_RE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+
+GAMES = {
+    # name: (menu index, text that shows the game has started)
+    "snake": ("1", "Score"),
+    "subnet": ("2", "TOTAL SCORE"),
+    "hangman": ("3", "missed:"),
+}
+
+# kind -> pattern that pulls host and cidr out of that kind of prompt
+SUBNET_QUESTIONS = [
+    re.compile(
+        re.escape(prompt.format(host="HOST", cidr="CIDR"))
+        .replace("HOST", r"(?P<host>\S+)")
+        .replace("CIDR", r"(?P<cidr>\d+)")
+    )
+    for prompt in PROMPTS
+]
+
+QUESTION_RE = re.compile(r"(?:What|what|How)[^\n]*\?")
+
+HANGMAN_LETTERS = "etaoinshrdlcumwfgypbvkjxqz"
+
+
+class Stats:
+    def __init__(self):
+        self.handshakes = []
+        self.frame_jitter = []
+        self.sessions = 0
+        self.failures = Counter()
+        self.bytes_received = 0
+
+    def report(self, elapsed):
+        print(f"sessions completed   {self.sessions}")
+        print(f"connection failures  {sum(self.failures.values())}")
+        for reason, count in self.failures.most_common():
+            print(f"    {reason:<24} {count}")
+        print(f"received             {self.bytes_received / elapsed / 1024:.1f} KiB/s")
+        for label, values, unit in (
+            ("handshake latency", self.handshakes, "ms"),
+            ("snake frame jitter", self.frame_jitter, "ms"),
+        ):
+            if not values:
+                continue
+            values.sort()
+            p50, p95, p99 = (
+                values[min(len(values) - 1, int(len(values) * p))]
+                for p in (0.5, 0.95, 0.99)
+            )
+            print(
+                f"{label:<20} p50 {p50:8.2f} {unit}  p95 {p95:8.2f} {unit}  "
+                f"p99 {p99:8.2f} {unit}  (n={len(values)})"
+            )
+
+
+class Session:
+    """
+    One connection playing one game
+    """
+
+    def __init__(self, args, stats, game):
+        self.args = args
+        self.stats = stats
+        self.game = game
+        self.text = ""
+        self.reader = None
+        self.writer = None
+
+    async def read(self, timeout=None):
+        data = await asyncio.wait_for(self.reader.read(4096), timeout)
+        if not data:
+            raise ConnectionResetError
+        self.stats.bytes_received += len(data)
+        self.text += ANSI_RE.sub("", data.decode(errors="replace"))
+        return time.perf_counter()
+
+    async def read_until(self, marker, timeout=30):
+        while marker not in self.text:
+            await self.read(timeout)
+        self.text = self.text[self.text.index(marker) + len(marker):]
+
+    def send(self, line):
+        self.writer.write(f"{line}\n".encode())
+
+    async def run(self):
+        start = time.perf_counter()
+        self.reader, self.writer = await asyncio.open_connection(
+            self.args.host, self.args.port
+        )
+        try:
+            # a reset here (throttled, token rejected, server draining)
+            # is a failure and is counted by client()
+            await self.handshake()
+            self.stats.handshakes.append((time.perf_counter() - start) * 1000)
+            try:
+                await getattr(self, f"play_{self.game}")()
+            except ConnectionResetError:
+                pass  # the server closes the connection when the game ends
+        finally:
+            self.writer.close()
+        self.stats.sessions += 1
+
+    async def handshake(self):
+        index, started = GAMES[self.game]
+        if self.args.legacy:
+            await self.read_until("play anonymously: ")
+            self.send("")
+            await self.read_until("Press enter to continue...")
+            self.send("")
+            await self.read_until("Choose a game...")
+            self.send(index)
+            if self.game == "snake":
+                await self.read_until("for no")
+                self.send("n")
+        else:
+            self.send(f"TNJ1 token= game={index} emoji=n realtime=1")
+        await self.read_until(started)
+
+    async def play_snake(self):
+        last = None
+        next_key = time.perf_counter()
+        while True:
+            now = time.perf_counter()
+            if now >= next_key:
+                # turn at human speed, a few keys a second
+                self.writer.write(random.choice("wasd").encode())
+                next_key = now + random.uniform(0.2, 1.0)
+            arrived = await self.read(timeout=5)
+            if last is not None:
+                self.stats.frame_jitter.append(
+                    abs(arrived - last - Snake.tick_interval) * 1000
+                )
+            last = arrived
+            if "GAME OVER" in self.text:
+                return
+
+    async def play_subnet(self):
+        while True:
+            question = await self.read_question()
+            answer = self.answer_subnet(question)
+            await asyncio.sleep(random.uniform(1, self.args.think_time))
+            if random.random() > self.args.accuracy:
+                # a wrong guess keeps the round going, then get it right
+                self.send("0")
+                await asyncio.sleep(random.uniform(1, self.args.think_time))
+            self.send(answer)
+            await self.read_until("Press enter to continue...", timeout=65)
+            self.send("")
+
+    async def read_question(self):
+        while True:
+            match = QUESTION_RE.search(self.text)
+            if match:
+                self.text = self.text[match.end():]
+                return match.group(0)
+            await self.read(timeout=65)
+
+    def answer_subnet(self, question):
+        for kind, pattern in enumerate(SUBNET_QUESTIONS):
+            match = pattern.search(question)
+            if match:
+                fields = match.groupdict()
+                host = int(ipaddress.IPv4Address(fields.get("host", "0.0.0.0")))
+                # the same mask arithmetic the server answers with
+                pool = QuestionPool(1, use_numpy=False)
+                pool.fill([host], [int(fields["cidr"])], [kind])
+                return pool.draw()[1]
+        return "0"
+
+    async def play_hangman(self):
+        letters = list(HANGMAN_LETTERS)
+        while letters:
+            await asyncio.sleep(random.uniform(0.3, self.args.think_time))
+            self.send(letters.pop(0))
+            while True:
+                try:
+                    await self.read(timeout=0.1)
+                except asyncio.TimeoutError:
+                    break
+
+
+async def client(args, stats, deadline, delay):
+    await asyncio.sleep(delay)
+    games, weights = zip(*args.mix.items())
+    while time.perf_counter() < deadline:
+        game = random.choices(games, weights)[0]
+        try:
+            await Session(args, stats, game).run()
+        except ConnectionResetError:
+            stats.failures["closed during handshake"] += 1
+            await asyncio.sleep(1)
+        except (OSError, asyncio.TimeoutError) as e:
+            stats.failures[type(e).__name__] += 1
+            await asyncio.sleep(1)
+
+
+async def main(args):
+    stats = Stats()
+    start = time.perf_counter()
+    deadline = start + args.duration
+    clients = [
+        asyncio.create_task(
+            client(args, stats, deadline, args.ramp * idx / args.clients)
+        )
+        for idx in range(args.clients)
+    ]
+    await asyncio.sleep(args.duration)
+    # sessions still playing are cut off, they aren't failures
+    for task in clients:
+        task.cancel()
+    await asyncio.gather(*clients, return_exceptions=True)
+    stats.report(time.perf_counter() - start)
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in GAMES:
+            raise argparse.ArgumentTypeError(f"unknown game {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=3333)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--ramp", type=float, default=10, help="seconds to connect all")
+    parser.add_argument(
+        "--mix", type=parse_mix, default=parse_mix("snake=3,subnet=1,hangman=1")
+    )
+    parser.add_argument("--think-time", type=float, default=3, help="max seconds")
+    parser.add_argument("--accuracy", type=float, default=0.7)
+    parser.add_argument(
+        "--legacy", action="store_true", help="answer prompts instead of a preamble"
+    )
+    asyncio.run(main(parser.parse_args()))
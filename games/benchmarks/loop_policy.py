@@ -0,0 +1,116 @@
+"""
+Compare the asyncio and uvloop event loops on the games server's hot
+paths: accepting connections and pacing Snake frames.
+
+Run from the games directory:
+
+    python -m benchmarks.loop_policy --connections 5000 --snakes 500
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from src.loops import LOOP_POLICIES, install_loop_policy
+from src.messages import TERMNINJA_PROMPT
+from src.player import Player
+from src.games.snake import Snake
+
+
+PROMPT = TERMNINJA_PROMPT.format("1) Snake").encode()
+
+
+async def _serve_prompt(reader, writer):
+    player = Player(reader, writer)
+    await player.send(PROMPT.decode())
+    writer.close()
+
+
+async def _connect_once(port):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    await reader.read()
+    writer.close()
+
+
+async def bench_connections(total, concurrency):
+    """
+    Connections per second where every connection receives the menu
+    """
+    server = await asyncio.start_server(_serve_prompt, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with semaphore:
+            await _connect_once(port)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[limited() for _ in range(total)])
+    elapsed = time.perf_counter() - start
+    server.close()
+    await server.wait_closed()
+    return total / elapsed
+
+
+async def _play_snake(reader, writer):
+    snake = Snake(Player(reader, writer))
+    try:
+        await snake.run()
+    except ConnectionResetError:
+        pass
+    finally:
+        writer.close()
+
+
+async def _watch_frames(port):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    arrivals = []
+    while await reader.read(4096):
+        arrivals.append(time.perf_counter())
+    writer.close()
+    return [b - a for a, b in zip(arrivals[1:], arrivals[2:])]
+
+
+async def bench_snake(count):
+    """
+    Deviation of Snake frame inter-arrival times from the tick interval
+    with count games running at once
+    """
+    await Snake._initialize()  # binds Game.time to this loop
+    server = await asyncio.start_server(_play_snake, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    results = await asyncio.gather(*[_watch_frames(port) for _ in range(count)])
+    server.close()
+    await server.wait_closed()
+    interval = Snake.tick_interval
+    return [abs(gap - interval) * 1000 for gaps in results for gap in gaps]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(policy, args):
+    install_loop_policy(policy)
+    rate = asyncio.run(bench_connections(args.connections, args.concurrency))
+    jitter = asyncio.run(bench_snake(args.snakes))
+    print(
+        f"{policy:>8}  {rate:10.0f} conn/s  "
+        f"frame jitter mean {statistics.mean(jitter):6.2f} ms  "
+        f"p99 {percentile(jitter, 99):6.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--connections", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--snakes", type=int, default=200)
+    parser.add_argument("--policy", choices=LOOP_POLICIES, action="append")
+    args = parser.parse_args()
+    for policy in args.policy or LOOP_POLICIES:
+        run(policy, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+A million question bank file compared to the same questions loaded into
+a list: time to write and open it, random reads per second and memory
+held by the process, then complete QuestionBankQuizGame sessions played
+from it on the virtual clock (see benchmarks.simulation).
+
+The questions are Subnet Racer's. Run from the games directory:
+
+    python -m benchmarks.question_bank --questions 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from src.game import QuestionBankQuizGame
+from src.question_bank import QuestionBank, write_question_bank
+from src.games.subnet_racer import QuestionPool
+from benchmarks.simulation import quiz_bot, report, simulate
+
+
+def generate(count):
+    pool = QuestionPool()
+    for _ in range(count):
+        yield pool.draw()
+
+
+def reads_per_second(read, size, seconds=2):
+    reads = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(1000):
+            read(random.randrange(size))
+        reads += 1000
+    return reads / (time.perf_counter() - start)
+
+
+def held_memory(load):
+    """
+    bytes of python memory held by what load returns
+    """
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    loaded = load()
+    held = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del loaded
+    return held
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--questions", type=int, default=1000000)
+    parser.add_argument("--sessions", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "subnets.tnqb")
+        start = time.perf_counter()
+        write_question_bank(path, generate(args.questions))
+        print(
+            f"wrote {args.questions} questions in "
+            f"{time.perf_counter() - start:.1f}s, "
+            f"{os.path.getsize(path) / 2**20:.1f} MiB"
+        )
+
+        start = time.perf_counter()
+        bank = QuestionBank(path)
+        opened = time.perf_counter() - start
+        start = time.perf_counter()
+        loaded = bank.read(range(len(bank)))
+        load = time.perf_counter() - start
+        bank_held = held_memory(lambda: QuestionBank(path))
+        list_held = held_memory(lambda: bank.read(range(len(bank))))
+        print(
+            f"open  bank {opened * 1000:8.2f} ms  list {load * 1000:8.0f} ms\n"
+            f"held  bank {bank_held / 2**20:8.2f} MiB list {list_held / 2**20:8.0f} MiB"
+        )
+        bank_reads = reads_per_second(bank.__getitem__, len(bank))
+        list_reads = reads_per_second(loaded.__getitem__, len(loaded))
+        print(f"reads bank {bank_reads:8.0f}/s   list {list_reads:8.0f}/s")
+        del loaded
+
+        class BankQuiz(QuestionBankQuizGame):
+            name = "Subnet Racer"
+            question_bank_path = path
+
+        report("bank quiz", simulate(BankQuiz, quiz_bot, args.sessions))
+        bank.close()
+
+
+if __name__ == "__main__":
+    main()
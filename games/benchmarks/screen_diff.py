@@ -0,0 +1,186 @@
+"""
+Bytes per frame sent by Snake and Hangman drawing through cursor.Screen
+compared to the previous frames, where every changed cell was written
+with its own HOME, SAVE, cursor moves and RESTORE.
+
+Run from the games directory:
+
+    python -m benchmarks.screen_diff --frames 5000
+"""
+import argparse
+import asyncio
+import random
+from src import cursor
+from src.player import Player
+from src.games import hangman
+from src.games.snake import Snake
+
+
+class _Writer:
+    def write(self, data):
+        pass
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+
+def legacy_replace_cell(board, x, y, val):
+    """
+    What AsciiBoard.replace_cell wrote before the screen buffer
+    """
+    x_offset = x * len(board.EMPTY_CELL) + board.PADDING + (
+        1 if len(board.EMPTY_CELL) == 1 else 3
+    )
+    return (
+        f"{cursor.HOME}{cursor.SAVE}"
+        f"{cursor.up(board.HEIGHT + 1 - y)}"
+        f"{cursor.move_to_column(x_offset)}"
+        f"{val}"
+        f"{cursor.RESTORE}"
+    )
+
+
+class WanderingSnake(Snake):
+    """
+    Turns at random instead of crashing into walls or itself
+    """
+
+    def on_tick(self):
+        pass
+
+    def check_game_over(self, new_head):
+        return False
+
+    def get_next_head(self):
+        for _ in range(4):
+            if random.random() < 0.3:
+                self.change_direction(random.choice("wasd"))
+            x, y = super().get_next_head()
+            x, y = x % self.board.WIDTH, y % self.board.HEIGHT
+            if (x, y) not in self.snake:
+                return x, y
+            self.change_direction(random.choice("wasd"))
+        return x, y
+
+
+def snake_frames(count, emoji):
+    """
+    (before, after) bytes for count Snake frames
+    """
+    player = Player(None, _Writer())
+    player.emoji_support = emoji
+    game = WanderingSnake(player)
+    board = game.board
+    game.initial_frame()
+    before = after = 0
+    for _ in range(count):
+        old_head, old_tail = game.snake[0], game.snake[-1]
+        earned = player.earned
+        new_frame = game.next_frame()
+        frame = legacy_replace_cell(board, *game.snake[0], board.HEAD)
+        frame += legacy_replace_cell(board, *old_head, board.BODY)
+        if player.earned != earned:
+            frame += legacy_replace_cell(board, *game.food)
+            frame += legacy_replace_cell(board, len(board.SCORE_MESSAGE), -2, earned)
+        else:
+            frame += legacy_replace_cell(board, *old_tail, board.EMPTY_CELL)
+        before += len(frame.encode())
+        after += len(new_frame.encode())
+    return before, after
+
+
+class RecordingBoard(hangman.HangmanBoard):
+    """
+    Draws into the screen and also keeps what the previous
+    HangmanBoard would have sent for the same calls
+    """
+
+    legacy = []
+
+    @classmethod
+    def draw_body_part(cls, screen, part, color=cursor.yellow):
+        x, y, char = cls.body_parts[part]
+        cls.legacy.append(cursor.replace_relative(cls.height - y, x + 1, color(char)))
+        super().draw_body_part(screen, part, color)
+
+    @classmethod
+    def draw_word(cls, screen, word):
+        out = f"{cursor.ERASE_TO_LINE_END}{word}"
+        cls.legacy.append(cursor.replace_relative(5, 18, out))
+        super().draw_word(screen, word)
+
+    @classmethod
+    def draw_letters(cls, screen, letters):
+        out = f"{cursor.ERASE_TO_LINE_END}{letters}"
+        cls.legacy.append(cursor.replace_relative(7, 26, out))
+        super().draw_letters(screen, letters)
+
+    @classmethod
+    def draw_result(cls, screen, result):
+        cls.legacy.append(cursor.replace_relative(3, 26, result))
+        super().draw_result(screen, result)
+
+
+class GuessingHangman(hangman.Hangman):
+    frame_delay = 0
+    with open(hangman.Hangman.wordlist) as f:
+        words = [line.split(" | ")[0] for line in f if " | " in line]
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.guesses = iter(random.sample("etaoinshrdlcumwfgypbvkjxqz", 26))
+
+    def get_random_word(self):
+        return random.choice(self.words), ""
+
+    async def get_player_choice(self):
+        return next(self.guesses)
+
+
+async def hangman_frames(count):
+    hangman.HangmanBoard = RecordingBoard
+    before = after = frames = 0
+    while frames < count:
+        game = GuessingHangman(Player(None, _Writer()))
+        game.initial_frame()
+        RecordingBoard.legacy.clear()
+        async for outputs in game.iter_frames():
+            if isinstance(outputs, str):
+                outputs = [outputs]
+            async for frame in _aiter(outputs):
+                before += len("".join(RecordingBoard.legacy).encode())
+                after += len(frame.encode())
+                RecordingBoard.legacy.clear()
+                frames += 1
+    return before, after, frames
+
+
+async def _aiter(outputs):
+    if isinstance(outputs, list):
+        for output in outputs:
+            yield output
+    else:
+        async for output in outputs:
+            yield output
+
+
+def report(label, before, after, frames):
+    print(
+        f"{label:<14} before {before / frames:7.1f} B/frame  "
+        f"after {after / frames:7.1f} B/frame  ({before / after:.1f}x less)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=5000)
+    args = parser.parse_args()
+
+    report("snake (ascii)", *snake_frames(args.frames, False), args.frames)
+    report("snake (emoji)", *snake_frames(args.frames, True), args.frames)
+    before, after, frames = asyncio.run(hangman_frames(args.frames))
+    report("hangman", before, after, frames)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Headless game sessions on a virtual clock: complete Snake, Hangman and
+Subnet Racer games played by scripted players as fast as the game logic
+runs, reporting sessions and frames per second, bytes emitted and, with
+--trace-memory, the memory it takes.
+
+The event loop's clock only moves when nothing is ready to run, then it
+jumps straight to the next timer, so ticks, asyncio.sleep and read
+timeouts cost nothing. Any Game subclass can be driven this way with a
+bot (see snake_bot), which makes this the base for per-game benchmarks.
+
+Run from the games directory:
+
+    python -m benchmarks.simulation --games snake,hangman --sessions 500
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import os
+import random
+import selectors
+import time
+import tracemalloc
+from src import game as game_module
+from src.player import Player
+from src.preamble import PREAMBLE_VERSION
+from src.games.hangman import Hangman
+from src.games.snake import Snake
+from src.games.subnet_racer import SubnetRacer
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """
+    Polls without blocking, when there's nothing to do the loop's clock
+    is moved forward by the time it would have waited instead
+    """
+
+    thread_timeout = 5  # real seconds
+
+    def __init__(self, loop):
+        super().__init__()
+        self._loop = loop
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            # only a thread (run_in_executor) can wake the loop up now
+            events = super().select(self.thread_timeout)
+            if not events:
+                raise RuntimeError("simulation deadlocked, nothing is scheduled")
+            return events
+        self._loop.advance(timeout)
+        return events
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop whose time starts at 0 and only advances when every task
+    is waiting on a timer
+    """
+
+    def __init__(self):
+        self._virtual_time = 0.0
+        super().__init__(_VirtualSelector(self))
+
+    def time(self):
+        return self._virtual_time
+
+    def advance(self, seconds):
+        self._virtual_time += seconds
+
+
+class ScriptedReader:
+    """
+    Stands in for the StreamReader, a script is an iterable of numbers
+    (seconds to wait) and strings (keys to send). It's resumed when the
+    player wants more input so a generator can look at the game first.
+    The connection is closed when the script ends.
+    """
+
+    def __init__(self, script=()):
+        self.script = iter(script)
+
+    async def read(self, n=-1):
+        for step in self.script:
+            if isinstance(step, str):
+                if step:
+                    return step.encode()
+            else:
+                await asyncio.sleep(step)
+        return b""
+
+
+class _Transport:
+    def __init__(self):
+        self.closing = False
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def is_closing(self):
+        return self.closing
+
+    def abort(self):
+        self.closing = True
+
+
+class _Writer:
+    def __init__(self):
+        self.transport = _Transport()
+
+    def write(self, data):
+        pass
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+    def write_eof(self):
+        pass
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.transport.closing = True
+
+    async def wait_closed(self):
+        pass
+
+
+def make_player(emoji=False):
+    """
+    Player on a scripted connection, the preamble answers the questions
+    games ask when someone connects
+    """
+    player = Player(ScriptedReader(), _Writer())
+    player.apply_preamble(f"{PREAMBLE_VERSION} realtime=1 emoji={'y' if emoji else 'n'}")
+    return player
+
+
+class _DropRounds:
+    """
+    Takes the place of the round writer, there's no database here
+    """
+
+    def add(self, slug, username, score, message="", snapshot=None):
+        pass
+
+
+class Results:
+    def __init__(self):
+        self.sessions = 0
+        self.frames = 0  # writes to the transport, once per loop iteration
+        self.bytes = 0
+        self.points = 0
+        self.errors = 0
+        self.last_error = None
+        self.wall_seconds = 0
+        self.virtual_seconds = 0
+        self.memory_per_frame = None  # bytes, with trace_memory
+        self.memory_peak = None
+
+    def add_player(self, player):
+        self.frames += player.flushes
+        self.bytes += player.bytes_sent
+        self.points += player.earned
+
+
+async def play_session(game_cls, bot, results, emoji=False):
+    """
+    Connect a player, play one complete game and tear it down, errors
+    are counted rather than stopping the simulation
+    """
+    player = make_player(emoji)
+    try:
+        await game_cls.on_player_connected(player)
+        game = game_cls(player)
+        player.reader.script = iter(bot(game))
+        await game._start()
+    except Exception as e:
+        results.errors += 1
+        results.last_error = e
+    results.sessions += 1
+    results.add_player(player)
+
+
+async def _play_sessions(game_cls, bot, sessions, concurrency, results, emoji):
+    remaining = iter(range(sessions))
+
+    async def worker():
+        for _ in remaining:
+            await play_session(game_cls, bot, results, emoji)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+
+def simulate(game_cls, bot, sessions, concurrency=1, emoji=False, trace_memory=False):
+    """
+    Play sessions games of game_cls, concurrency at a time, with bot(game)
+    as each game's script
+    """
+    results = Results()
+    loop = VirtualClockLoop()
+    round_writer, game_module.round_writer = game_module.round_writer, _DropRounds()
+    # games and players print as they go, that's not what's measured
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            if trace_memory:
+                tracemalloc.start()
+                baseline = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            loop.run_until_complete(
+                _play_sessions(game_cls, bot, sessions, concurrency, results, emoji)
+            )
+            results.wall_seconds = time.perf_counter() - start
+            results.virtual_seconds = loop.time()
+            if trace_memory:
+                # players and their bots' games reference each other
+                gc.collect()
+                current, peak = tracemalloc.get_traced_memory()
+                results.memory_peak = peak - baseline
+                results.memory_per_frame = (current - baseline) / max(results.frames, 1)
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+            game_module.round_writer = round_writer
+            # the tick scheduler waits for one more tick after the last game
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(
+                    asyncio.gather(*pending, return_exceptions=True)
+                )
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+    return results
+
+
+def snake_bot(game):
+    """
+    Heads for the food every tick, avoiding the walls and its own body
+    one step ahead, with some randomness in which way it turns
+    """
+    while True:
+        yield game.tick_interval
+        yield _steer_snake(game)
+
+
+def _steer_snake(game):
+    head_x, head_y = game.snake[0]
+    food_x, food_y = game.food[:2] if game.food is not None else (head_x, head_y)
+    best = None
+    for key in "wasd":
+        dx, dy = game.directions[key]
+        if (dx, dy) != game.direction and key not in game.valid_directions[game.direction]:
+            continue
+        cell = (head_x + dx, head_y + dy)
+        if game.check_game_over(cell):
+            continue
+        distance = abs(food_x - cell[0]) + abs(food_y - cell[1]) + random.random() * 4
+        if best is None or distance < best[0]:
+            best = (distance, key)
+    if best is None or game.directions[best[1]] == game.direction:
+        return ""  # nothing to send
+    return best[1]
+
+
+LETTERS_BY_FREQUENCY = "etaoinsrhldcumfpgwybvkxjqz"
+
+
+def hangman_bot(game):
+    """
+    Guesses the most common letters first, one every second
+    """
+    for letter in LETTERS_BY_FREQUENCY:
+        yield 1
+        yield f"{letter}\n"
+
+
+def quiz_bot(game):
+    """
+    Wrong answers every few seconds, so every question runs its course
+    """
+    while True:
+        yield random.uniform(1, 5)
+        yield "0.0.0.0\n"
+
+
+GAMES = {
+    "snake": (Snake, snake_bot),
+    "hangman": (Hangman, hangman_bot),
+    "subnet-racer": (SubnetRacer, quiz_bot),
+}
+
+
+def report(name, results):
+    line = (
+        f"{name:<13} {results.sessions / results.wall_seconds:8.0f} sessions/s  "
+        f"{results.frames / results.wall_seconds:9.0f} frames/s  "
+        f"{results.frames / results.sessions:7.1f} frames/session  "
+        f"{results.bytes / results.frames:6.1f} B/frame  "
+        f"{results.points / results.sessions:5.1f} points/session  "
+        f"{results.virtual_seconds / results.wall_seconds:7.0f}x real time"
+    )
+    if results.memory_per_frame is not None:
+        line += (
+            f"  retained {results.memory_per_frame:6.1f} B/frame"
+            f"  peak {results.memory_peak / 1024:7.1f} KiB"
+        )
+    if results.errors:
+        line += f"  {results.errors} errors, last {results.last_error!r}"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--games", type=lambda v: v.split(","), default=list(GAMES),
+        help=", ".join(GAMES),
+    )
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--emoji", action="store_true")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument(
+        "--trace-memory", action="store_true",
+        help="track allocations with tracemalloc, much slower",
+    )
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    for name in args.games:
+        game_cls, bot = GAMES[name]
+        results = simulate(
+            game_cls, bot, args.sessions, concurrency=args.concurrency,
+            emoji=args.emoji, trace_memory=args.trace_memory,
+        )
+        report(name, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Headless Snake ticks per second for snakes of different lengths, on
+SnakeBody compared to the list the snake used to be kept in (insert at
+the front, scanning the body for crashes and building the set of free
+cells whenever food is eaten).
+
+The snake follows a cycle through every cell of a 200x100 board so it
+never crashes, food is eaten every --eat-every ticks. Run from the
+games directory:
+
+    python -m benchmarks.snake_engine --lengths 10,500,5000
+"""
+import argparse
+import random
+import time
+from src.player import Player
+from src.games.snake import AsciiBoard, Snake, SnakeBody
+
+
+class BigBoard(AsciiBoard):
+    WIDTH = 200
+    HEIGHT = 100
+
+
+class _Writer:
+    def write(self, data):
+        pass
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+
+def make_cycle(width, height):
+    """
+    next cell for every cell of a cycle through the whole board: along
+    the rows from column 1 and back up column 0 (height must be even)
+    """
+    path = []
+    for y in range(height):
+        columns = range(1, width) if y % 2 == 0 else range(width - 1, 0, -1)
+        path.extend((x, y) for x in columns)
+    path.extend((0, y) for y in range(height - 1, -1, -1))
+    return {cell: path[(idx + 1) % len(path)] for idx, cell in enumerate(path)}, path
+
+
+class CyclingSnake(Snake):
+    eat_every = 50
+
+    def __init__(self, player, length):
+        super().__init__(player)
+        self.board = BigBoard
+        self.screen = BigBoard.make_screen()
+        self.next_cell, path = make_cycle(BigBoard.WIDTH, BigBoard.HEIGHT)
+        self.set_body(path[length - 1::-1])
+        self.spawn_food()
+        self.ticks = 0
+
+    def set_body(self, cells):
+        self.snake = SnakeBody(self.board.WIDTH, self.board.HEIGHT, cells)
+
+    def get_next_head(self):
+        return self.next_cell[self.snake[0]]
+
+    def check_eats_food(self, new_head):
+        self.ticks += 1
+        return self.ticks % self.eat_every == 0
+
+
+class ListSnake(CyclingSnake):
+    """
+    How the snake moved before SnakeBody
+    """
+
+    def set_body(self, cells):
+        self.snake = list(cells)
+
+    def next_frame(self):
+        new_head = self.get_next_head()
+        if self.check_game_over(new_head):
+            return None
+        board, screen = self.board, self.screen
+        board.replace_cell(screen, *new_head, board.HEAD)
+        board.replace_cell(screen, *self.snake[0], board.BODY)
+        self.snake.insert(0, new_head)
+        if self.check_eats_food(new_head):
+            self.spawn_food()
+            self.player.add_points(1)
+            board.replace_cell(screen, *self.food)
+            board.replace_score(screen, self.player.earned)
+        else:
+            old_tail = self.snake.pop()
+            board.replace_cell(screen, *old_tail, board.EMPTY_CELL)
+        return screen.render()
+
+    def spawn_food(self):
+        cell = random.choice(list(self.board.ALL_CELLS - set(self.snake)))
+        self.food = (*cell, random.choice(self.board.FOODS))
+
+    def check_game_over(self, new_head):
+        x, y = new_head
+        if not 0 <= x <= self.board.WIDTH - 1:
+            return True
+        if not 0 <= y <= self.board.HEIGHT - 1:
+            return True
+        for cell in self.snake:
+            if cell == new_head:
+                return True
+        return False
+
+
+def ticks_per_second(game_cls, length, seconds):
+    player = Player(None, _Writer())
+    player.emoji_support = False
+    game = game_cls(player, length)
+    game.initial_frame()
+    ticks = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            assert game.next_frame() is not None
+        ticks += 100
+    return ticks / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--lengths", type=lambda v: [int(n) for n in v.split(",")],
+        default=[10, 500, 5000],
+    )
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--eat-every", type=int, default=CyclingSnake.eat_every)
+    args = parser.parse_args()
+    CyclingSnake.eat_every = args.eat_every
+
+    for length in args.lengths:
+        before = ticks_per_second(ListSnake, length, args.seconds)
+        after = ticks_per_second(CyclingSnake, length, args.seconds)
+        print(
+            f"length {length:6d}  list {before:9.0f} ticks/s  "
+            f"SnakeBody {after:9.0f} ticks/s  ({after / before:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Subnet Racer questions per second from the QuestionPool (with numpy and
+in plain python) compared to building an ipaddress.IPv4Network for every
+question the way get_question used to. Every answer the pool works out
+for --check random questions is first compared to ipaddress's.
+
+Run from the games directory:
+
+    python -m benchmarks.subnet_questions --questions 200000
+"""
+import argparse
+import ipaddress
+import itertools
+import random
+import time
+from src.games import subnet_racer
+from src.games.subnet_racer import PROMPTS, QuestionPool, WEIGHTS
+
+CIDRS = list(itertools.chain(*[
+    [idx for _ in range(WEIGHTS[idx])]
+    for idx in range(0, 32)
+]))
+
+
+def legacy_question(host, cidr, kind):
+    """
+    What the ipaddress based question functions returned
+    """
+    if kind >= subnet_racer.FIRST_HOST and cidr > 30:
+        cidr = 30
+    network = ipaddress.IPv4Network(f"{host}/{cidr}", strict=False)
+    if kind == subnet_racer.BROADCAST:
+        answer = network.broadcast_address
+    elif kind == subnet_racer.NETWORK_ID:
+        answer = network.network_address
+    elif kind == subnet_racer.SUBNET_MASK:
+        answer = network.netmask
+    elif kind == subnet_racer.FIRST_HOST:
+        answer = network.network_address + 1
+    elif kind == subnet_racer.LAST_HOST:
+        answer = network.broadcast_address - 1
+    else:
+        answer = 2**(32-cidr) - 2
+    return PROMPTS[kind].format(host=host, cidr=cidr), f"{answer}"
+
+
+def legacy_get_question():
+    octets = [str(random.randint(0, 255)) for _ in range(4)]
+    host = ".".join(octets)
+    cidr = random.choice(CIDRS)
+    return legacy_question(host, cidr, random.randrange(len(PROMPTS)))
+
+
+def check(pool, count):
+    hosts = [random.getrandbits(32) for _ in range(count)]
+    # every cidr, weighted or not, and the edges of the address space
+    cidrs = [idx % 33 for idx in range(count)]
+    kinds = [random.randrange(len(PROMPTS)) for _ in range(count)]
+    hosts[:4] = [0, 1, 2**31, 2**32 - 1]
+    pool.fill(hosts, cidrs, kinds)
+    for host, cidr, kind in zip(hosts, cidrs, kinds):
+        host = subnet_racer.format_address(host)
+        expected = legacy_question(host, cidr, kind)
+        actual = pool.draw()
+        assert actual == expected, f"{actual} != {expected}"
+
+
+def questions_per_second(get_question, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        get_question()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--questions", type=int, default=200000)
+    parser.add_argument("--check", type=int, default=100000)
+    parser.add_argument("--pool-size", type=int, default=4096)
+    args = parser.parse_args()
+
+    before = questions_per_second(legacy_get_question, args.questions)
+    print(f"ipaddress      {before:9.0f} questions/s")
+    for use_numpy in (False, True):
+        if use_numpy and subnet_racer.numpy is None:
+            print("numpy isn't installed")
+            continue
+        check(QuestionPool(args.check, use_numpy=use_numpy), args.check)
+        pool = QuestionPool(args.pool_size, use_numpy=use_numpy)
+        after = questions_per_second(pool.draw, args.questions)
+        label = "pool (numpy)" if use_numpy else "pool (python)"
+        print(f"{label:<14} {after:9.0f} questions/s  ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Compare Snake on the shared TickScheduler against the previous loop
+where every game slept on its own timer between frames.
+
+Players are in memory so only the event loop's work is measured. Run
+from the games directory:
+
+    python -m benchmarks.tick_scheduler --snakes 100 1000 5000 --seconds 20
+
+Jitter depends on load, compare at more than one.
+"""
+import argparse
+import asyncio
+import time
+from src.game import get_tick_scheduler
+from src.player import Player
+from src.games.snake import Snake
+from .loop_policy import percentile
+
+
+class FrameRecorder:
+    """
+    Stands in for a StreamWriter and its transport, remembers when
+    frames were written
+    """
+
+    def __init__(self):
+        self.arrivals = []
+        self.transport = self
+
+    def write(self, data):
+        self.arrivals.append(time.perf_counter())
+
+    async def drain(self):
+        pass
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def is_closing(self):
+        return False
+
+
+class EndlessSnake(Snake):
+    """
+    Wraps around the board instead of crashing, nobody steers it
+    """
+
+    def check_game_over(self, new_head):
+        return False
+
+    def get_next_head(self):
+        x, y = super().get_next_head()
+        return x % self.board.WIDTH, y % self.board.HEIGHT
+
+    def check_eats_food(self, new_head):
+        return False
+
+
+class PerGameLoopSnake(EndlessSnake):
+    """
+    The loop Snake.run used before the shared scheduler
+    """
+
+    async def run(self):
+        await self.player.send(self.initial_frame())
+        while True:
+            await self.player.send(self.next_frame())
+            waited = await self._input_opportunity()
+            await asyncio.sleep(self.tick_interval - waited)
+
+    async def _input_opportunity(self):
+        try:
+            start = self.time
+            inp = await self.player.read(8, timeout=self.tick_interval)
+            self.change_direction(inp[0])
+            return self.time - start
+        except asyncio.TimeoutError:
+            return self.tick_interval
+
+
+async def bench(game_cls, count, seconds):
+    await game_cls._initialize()  # binds Game.time to this loop
+    loop = asyncio.get_running_loop()
+    writers = []
+    tasks = []
+    for _ in range(count):
+        writer = FrameRecorder()
+        writers.append(writer)
+        game = game_cls(Player(asyncio.StreamReader(), writer))
+        tasks.append(asyncio.create_task(game.run()))
+
+    timers = []
+    cpu = time.process_time()
+    deadline = loop.time() + seconds
+    while loop.time() < deadline:
+        await asyncio.sleep(0.5)
+        # pylint: disable=protected-access
+        timers.append(len(loop._scheduled))
+    cpu = time.process_time() - cpu
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    interval = game_cls.tick_interval
+    jitter = [
+        abs(b - a - interval) * 1000
+        for writer in writers
+        # the first gaps are still ramping up
+        for a, b in zip(writer.arrivals[5:], writer.arrivals[6:])
+    ]
+    frames = sum(len(writer.arrivals) for writer in writers)
+    return frames / seconds, cpu / seconds, max(timers), jitter
+
+
+def format_ms(values, pct):
+    if not values:
+        return "    n/a"  # no game got enough frames
+    return f"{percentile(values, pct):7.2f}"
+
+
+def run(label, game_cls, count, seconds):
+    fps, cpu, timers, jitter = asyncio.run(bench(game_cls, count, seconds))
+    print(
+        f"{label:>10}  {fps:8.0f} frames/s  cpu {cpu * 100:5.1f}%  "
+        f"timers {timers:6d}  jitter p50 {format_ms(jitter, 50)} ms  "
+        f"p99 {format_ms(jitter, 99)} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--snakes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+    scheduler = get_tick_scheduler(Snake.tick_interval)
+    for count in args.snakes:
+        print(f"{count} snakes, ideal {count / Snake.tick_interval:.0f} frames/s")
+        run("per game", PerGameLoopSnake, count, args.seconds)
+        skipped = scheduler.ticks_skipped
+        run("scheduler", EndlessSnake, count, args.seconds)
+        print(f"scheduler skipped {scheduler.ticks_skipped - skipped} ticks")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +0,0 @@
-import uvloop
-
-uvloop.install()
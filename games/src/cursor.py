@@ -1,18 +1,8 @@
 import re
-import bleach
+import unicodedata
+from termninja_db.snapshots import ansi_to_html, get_color_for  # noqa: F401
 
 
-color_codes_to_style = {
-    '31': 'red',
-    '32': 'lime',
-    '33': 'yellow',
-    '36': 'cyan',
-    '35': 'magenta'
-}
-OPEN_SEQUENCE_RE = re.compile(
-    r'\x1b\[(?P<sequence>.*?)(?P<terminator>[msuJKHABG]{1})'
-)
-
 ESCAPE = "\x1b["
 RESET = f"{ESCAPE}0m"
 CLEAR = f"{ESCAPE}2J"
@@ -91,42 +81,220 @@ def color_by_percentage(percent, msg):
     return green(msg)
 
 
-def get_color_for(color_code):
-    return color_codes_to_style.get(color_code, '')
-
-
-def make_span(match):
-    if not match.group('terminator') == 'm':
-        # it's something other than a color
-        return ""
-
-    # it's a color, make a span
-    color = match.group('sequence').split(';')[0]
-    return f'<span style="color: {get_color_for(color)}">'
-
-
-def ansi_to_html(ansi, centered=True, bold=True):
-    # make newlines into <br/> tags
-    ret = ansi.replace('\n', '<br/>')
-
-    # make RESET into </span>
-    ret = ret.replace('\x1b[0m', '</span>')
-
-    # replace the rest of the sequences according to
-    # make_span
-    html = re.sub(OPEN_SEQUENCE_RE, make_span, ret)
-
-    classes = 'text-center' if centered else ''
-    classes += ' font-weight-bold' if bold else ''
-
-    # clean the resulting html just to be sure, there
-    # is bound to be user input in the original ansi
-    # depending on how it's being used. Probably still
-    # not necessary because we are explicitly definining
-    # the tags that are allowed, but still, better safe.
-    return bleach.clean(
-        f'<pre class="{classes}">{html}</pre>',
-        tags=['span', 'br', 'pre'],
-        attributes=['style', 'class'],
-        styles=['color', 'background-color', 'padding', 'width']
-    )
+def move_right(n):
+    return f"{ESCAPE}{n}C"
+
+
+def move_left(n):
+    return f"{ESCAPE}{n}D"
+
+
+def style(params):
+    return f"{ESCAPE}{params}m" if params else RESET
+
+
+STYLE_RE = re.compile(r"\x1b\[([0-9;]*)m")
+BLANK = (" ", "")
+
+
+def char_width(char):
+    return 2 if unicodedata.east_asian_width(char) in "WF" else 1
+
+
+class Screen:
+    """
+    What a region of the client's terminal shows, height lines right
+    above the cursor. Between frames the cursor is parked at the start
+    of the line below the region, the way printing it leaves it.
+
+    Games put text into the screen, draw() prints the whole region the
+    first time and render() returns the shortest escape sequences that
+    bring the terminal up to date with everything put since. Cells are
+    a character and the SGR parameters it's shown with, the second
+    column of a wide character (emoji) is an empty character.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self._cells = [[BLANK] * width for _ in range(height)]
+        self._shown = [[BLANK] * width for _ in range(height)]
+        self._dirty = {}  # row -> [first, last + 1) column put since render
+
+    def put(self, x, y, text):
+        """
+        Write text at column x of row y. Color sequences in text are
+        applied to the characters that follow them, a newline continues
+        at the start of the next row and anything past the edges of the
+        screen is cut off.
+        """
+        params = ""
+        start = 0
+        for match in STYLE_RE.finditer(text):
+            x, y = self._put_plain(x, y, text[start:match.start()], params)
+            params = match.group(1)
+            if params == "0":
+                params = ""
+            start = match.end()
+        self._put_plain(x, y, text[start:], params)
+
+    def clear_to_end(self, x, y):
+        """
+        Blank row y from column x on, like ERASE_TO_LINE_END
+        """
+        self._put_plain(x, y, " " * (self.width - x), "")
+
+    def draw(self):
+        """
+        The whole region as text, printed where the cursor is
+        """
+        lines = []
+        for y, row in enumerate(self._cells):
+            end = len(row)
+            while end and row[end - 1] == BLANK:
+                end -= 1
+            out = []
+            current = self._write(out, row, 0, end, "")
+            if current:
+                out.append(RESET)
+            lines.append("".join(out))
+            self._shown[y] = row[:]
+        self._dirty.clear()
+        return "\n".join(lines) + "\n"
+
+    def redraw(self):
+        """
+        Reprint the whole region over what the terminal shows
+        """
+        lines = self.draw().split("\n")
+        return (
+            f"{HOME}{up(self.height)}"
+            + f"{ERASE_TO_LINE_END}\n".join(lines[:-1])
+            + f"{ERASE_TO_LINE_END}\n"
+        )
+
+    def render(self):
+        """
+        Escape sequences for what changed since the last draw or render,
+        neighbouring changes are merged when rewriting the cells between
+        them is shorter than moving the cursor over them
+        """
+        out = []
+        cy = self.height
+        current = ""
+        for y in sorted(self._dirty):
+            row, shown = self._cells[y], self._shown[y]
+            first, last = self._dirty[y]
+            runs = self._changed_runs(row, shown, first, last)
+            if not runs:
+                continue
+            start, end = runs[0]
+            # keys the terminal echoed may have moved the cursor along the
+            # row, so the first move on every row is to an absolute column
+            out.append(self._move(None, cy, start, y))
+            for next_start, next_end in runs[1:]:
+                current = self._write(out, row, start, end, current)
+                gap = []
+                gap_style = self._write(gap, row, end, next_start, current)
+                move = self._move(end, y, next_start, y)
+                if len("".join(gap)) <= len(move):
+                    out.extend(gap)
+                    current = gap_style
+                else:
+                    out.append(move)
+                start, end = next_start, next_end
+            current = self._write(out, row, start, end, current)
+            cy = y
+            shown[first:last] = row[first:last]
+        self._dirty.clear()
+        if not out:
+            return ""
+        if current:
+            out.append(RESET)
+        out.append(self._move(None, cy, 0, self.height))
+        return "".join(out)
+
+    def _put_plain(self, x, y, text, params):
+        for char in text:
+            if char == "\n":
+                x, y = 0, y + 1
+                continue
+            width = char_width(char)
+            if 0 <= y < self.height and 0 <= x and x + width <= self.width:
+                row = self._cells[y]
+                self._release(row, x)
+                if width == 2:
+                    self._release(row, x + 1)
+                    row[x + 1] = ("", params)
+                row[x] = (char, params)
+                # _release can change the cells on either side
+                first, last = max(x - 1, 0), min(x + width + 1, self.width)
+                span = self._dirty.get(y)
+                if span is None:
+                    self._dirty[y] = [first, last]
+                else:
+                    span[0] = min(span[0], first)
+                    span[1] = max(span[1], last)
+            x += width
+        return x, y
+
+    def _release(self, row, x):
+        # x is about to be overwritten, don't leave half a wide character
+        if row[x][0] == "" and x > 0:
+            row[x - 1] = (" ", row[x - 1][1])
+        if x + 1 < len(row) and row[x + 1][0] == "":
+            row[x + 1] = (" ", row[x + 1][1])
+
+    def _changed_runs(self, row, shown, first, last):
+        runs = []
+        x = first
+        width = len(row)
+        while x < last:
+            if row[x] == shown[x]:
+                x += 1
+                continue
+            start = x - 1 if row[x][0] == "" and x > 0 else x
+            while x < width and (row[x] != shown[x] or row[x][0] == ""):
+                x += 1
+            runs.append((start, x))
+        return runs
+
+    def _write(self, out, row, start, end, current):
+        """
+        Append cells start to end to out, returns the style left set
+        """
+        for char, params in row[start:end]:
+            if not char:
+                continue  # covered by the wide character before it
+            if params != current:
+                out.append(RESET if not params else style(
+                    params if not current else f"0;{params}"
+                ))
+                current = params
+            out.append(char)
+        return current
+
+    def _move(self, cx, cy, x, y):
+        vertical = ""
+        if y < cy:
+            vertical = up(cy - y)
+        elif y > cy:
+            vertical = down(y - cy)
+        return vertical + self._move_column(cx, x)
+
+    def _move_column(self, cx, x):
+        """
+        To column x from column cx, or from anywhere on the row when cx
+        is None
+        """
+        if x == cx:
+            return ""
+        if x == 0:
+            return "\r"
+        if cx is None:
+            return move_to_column(x + 1)
+        if x > cx:
+            relative = move_right(x - cx)
+        else:
+            relative = move_left(cx - x)
+        return min(move_to_column(x + 1), relative, key=len)
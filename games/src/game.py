@@ -1,38 +1,68 @@
 import asyncio
 import aiohttp
 import os
+import time
 import uuid
-import termninja_db as db
 from slugify import slugify
 from abc import ABCMeta, abstractmethod
-from . import cursor
+from termninja_db.snapshots import encode_snapshot
+from . import cursor, metrics
+from .question_bank import get_question_bank
+from .round_writer import round_writer
 from .messages import (
     GENERIC_QUIZ_INITIAL_QUESTION,
     GENERIC_QUIZ_PROGRESS_UPDATE,
     GENERIC_QUIZ_CLEAR_ENTRY,
     GENERIC_QUIZ_INTERMISSION_REPORT,
     SUPPORTS_EMOJIS_PROMPT,
+    SERVER_DRAINING_NOTICE,
 )
 
 
+# every game being played right now, task -> Game instance
+running_games = {}
+
+
 class StoreGamesMixin:
+    # shared by all games. A round is owed for every player from the
+    # moment a game starts until it is handed to the round writer
+    rounds_pending = 0
+    rounds_lost = 0
+
+    def __init__(self, *players):
+        super().__init__(*players)
+        StoreGamesMixin.rounds_pending += len(players)
+
     async def teardown(self):
         await asyncio.gather(super().teardown(), self.store_round_played())
 
     async def store_round_played(self):
         """
-        For each player, record the fact that this player
-        played this game in the db
+        For each player, queue a record of the fact that this player
+        played this game to be written to the db
         """
-        await asyncio.gather(*[self.add_round_played(p) for p in self._players])
+        await asyncio.gather(*[self._store_round(p) for p in self._players])
+
+    async def _store_round(self, player):
+        try:
+            await self.add_round_played(player)
+        except Exception as e:
+            StoreGamesMixin.rounds_lost += 1
+            metrics.rounds_lost.inc()
+            print(f"[!] failed to store round of {self.slug}: {e!r}")
+        finally:
+            StoreGamesMixin.rounds_pending -= 1
 
     async def add_round_played(self, player, **kwargs):
-        await db.rounds.add_round_played(
-            self.slug,
-            player.identity["username"],  # this gives us None for anonymous
-            player.earned,
-            **kwargs,
-        )
+        username = player.identity["username"]  # this gives us None for anonymous
+        round_writer.add(self.slug, username, player.earned, **kwargs)
+
+
+metrics.Gauge(
+    "termninja_rounds_pending",
+    "Rounds owed for games in progress",
+    fn=lambda: StoreGamesMixin.rounds_pending,
+)
 
 
 class StoreGamesWithResultMessageMixin(StoreGamesMixin):
@@ -58,10 +88,11 @@ class StoreGamesWithSnapshotMixin(StoreGamesMixin):
         )
 
     def _get_snapshot(self):
+        # stored as ANSI, it's converted to html when someone looks at it
         snapshot = self.make_final_snapshot()
         centered = getattr(self, "center_snapshot", True)
         bold = getattr(self, "bold_snapshot", True)
-        return cursor.ansi_to_html(snapshot, centered=centered, bold=bold)
+        return encode_snapshot(snapshot, centered=centered, bold=bold)
 
     def make_final_snapshot(self):
         raise NotImplementedError
@@ -70,10 +101,11 @@ class StoreGamesWithSnapshotMixin(StoreGamesMixin):
 class PromptForEmojiSupportMixin:
     @classmethod
     async def on_player_connected(cls, player):
-        await player.send(SUPPORTS_EMOJIS_PROMPT)
-        response = await player.readline()
-        if response.lower().startswith("n"):
-            player.emoji_support = False
+        if "emoji" not in player.preamble:
+            await player.send(SUPPORTS_EMOJIS_PROMPT)
+            response = await player.readline()
+            if response.lower().startswith("n"):
+                player.emoji_support = False
         return await super().on_player_connected(player)
 
 
@@ -97,7 +129,8 @@ class Game(metaclass=ABCMeta):
 
     @property
     def time(self):
-        return self.__loop.time()
+        # whichever loop runs the game, see benchmarks.simulation
+        return asyncio.get_event_loop().time()
 
     @classmethod
     async def player_connected(cls, player):
@@ -112,7 +145,6 @@ class Game(metaclass=ABCMeta):
 
     @classmethod
     async def _initialize(cls):
-        cls.__loop = asyncio.get_running_loop()
         cls.__queue = asyncio.Queue()
         asyncio.create_task(cls._launcher())
 
@@ -121,7 +153,10 @@ class Game(metaclass=ABCMeta):
         while True:
             players = [await cls.__queue.get() for _ in range(cls.player_count)]
             instance = cls(*players)
-            asyncio.create_task(instance._start())
+            task = asyncio.create_task(instance._start())
+            running_games[task] = instance
+            metrics.game_sessions.inc(game=cls.slug)
+            task.add_done_callback(running_games.pop)
 
     @property
     def player(self):
@@ -135,11 +170,15 @@ class Game(metaclass=ABCMeta):
         """
         Call run and handle any errors. should not be overriden.
         """
+        start = time.perf_counter()
         try:
             await self.run()
         except (BrokenPipeError, ConnectionResetError):
             await self.on_disconnect()
         finally:
+            metrics.game_duration_seconds.observe(
+                time.perf_counter() - start, game=self.slug
+            )
             await self.teardown()
 
     @abstractmethod
@@ -156,6 +195,13 @@ class Game(metaclass=ABCMeta):
         """
         pass
 
+    async def on_server_draining(self):
+        """
+        Hook called when the server is shutting down, the game
+        is given some time to finish before it's cancelled.
+        """
+        await self.send_to_players(SERVER_DRAINING_NOTICE)
+
     async def teardown(self):
         """
         Close all player streams
@@ -169,6 +215,197 @@ class Game(metaclass=ABCMeta):
         return await asyncio.gather(*[p.send(msg) for p in self._players])
 
 
+class TickScheduler:
+    """
+    Fixed rate clock shared by every real-time game with the same tick
+    interval. The loop keeps one timer at a time instead of one per
+    game. Games are spread over phases phase_length apart within the
+    interval, each phase's games are ticked (and their frames flushed)
+    together, so a game's frame only waits for the games in its phase
+    rather than for every game's on_tick. Phases are only added as
+    earlier ones fill up to phase_size games.
+    """
+
+    phase_length = 0.005  # seconds
+    # games per phase before the next phase is used, a wakeup for only a
+    # few games costs more than it saves
+    phase_size = 32
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.ticks = 0
+        self.ticks_skipped = 0
+        count = max(1, int(interval / self.phase_length))
+        self._phases = [{} for _ in range(count)]  # insertion ordered sets
+        self._phase_of = {}  # game -> its phase
+        self._task = None
+
+    def __len__(self):
+        return len(self._phase_of)
+
+    def register(self, game):
+        used = min(len(self._phases), 1 + len(self._phase_of) // self.phase_size)
+        phase = min(self._phases[:used], key=len)
+        phase[game] = None
+        self._phase_of[game] = phase
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    def unregister(self, game):
+        phase = self._phase_of.pop(game, None)
+        if phase is not None:
+            phase.pop(game, None)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        step = self.interval / len(self._phases)
+        deadline = loop.time()
+        try:
+            while self._phase_of:
+                deadline += self.interval
+                now = loop.time()
+                if now > deadline + self.interval:
+                    # fell behind, skip the missed ticks rather than
+                    # sending a burst of frames
+                    missed = int((now - deadline) // self.interval)
+                    self.ticks_skipped += missed
+                    deadline += missed * self.interval
+                for idx, phase in enumerate(self._phases):
+                    if not phase:
+                        continue
+                    await asyncio.sleep(deadline + idx * step - loop.time())
+                    for game in list(phase):
+                        game._on_tick()
+                self.ticks += 1
+        finally:
+            self._task = None
+
+
+# tick interval -> TickScheduler
+_tick_schedulers = {}
+
+
+def get_tick_scheduler(interval):
+    scheduler = _tick_schedulers.get(interval)
+    if scheduler is None:
+        scheduler = _tick_schedulers[interval] = TickScheduler(interval)
+    return scheduler
+
+
+class RealTimeGame(Game):
+    """
+    Base for games that advance on a clock. on_tick is called every
+    tick_interval by the shared TickScheduler, it takes what the players
+    typed with read_input. on_tick is synchronous, write frames with
+    write_frame and call finish() when the game is over.
+
+    Frames for a client that isn't keeping up are dropped, latest state
+    wins: it gets redraw_frame once its backlog clears, and is
+    disconnected if it stays behind for longer than stall_limit.
+    """
+
+    tick_interval = 0.17
+    # bytes waiting to be sent past which frames are dropped
+    frame_high_water = 2 ** 14
+    # and below which the client has caught up
+    frame_low_water = 2 ** 12
+    # seconds a client can stay behind before it's disconnected
+    stall_limit = float(os.environ.get("TERMNINJA_STALL_LIMIT", 10))
+
+    def __init__(self, *players):
+        super().__init__(*players)
+        self._finished = None
+        self._stalled = {}  # player -> when they fell behind
+
+    async def run(self):
+        self._finished = asyncio.get_running_loop().create_future()
+        scheduler = get_tick_scheduler(self.tick_interval)
+        self.on_start()
+        scheduler.register(self)
+        try:
+            await self._finished
+        finally:
+            scheduler.unregister(self)
+        await self.on_finish()
+
+    def _on_tick(self):
+        try:
+            for player in self.players:
+                if player.disconnected:
+                    raise ConnectionResetError
+                self._check_backlog(player)
+            self.on_tick()
+        except Exception as e:
+            self.finish(e)
+
+    def _check_backlog(self, player):
+        backlog = player.output_backlog
+        stalled_at = self._stalled.get(player)
+        if stalled_at is None:
+            if backlog > self.frame_high_water:
+                self._stalled[player] = self.time
+        elif backlog < self.frame_low_water:
+            # caught up, before this tick's frame is written
+            del self._stalled[player]
+            player.write(self.redraw_frame(player))
+        elif self.time - stalled_at > self.stall_limit:
+            print(f"[-] {player.username} can't keep up, disconnecting")
+            metrics.slow_clients_disconnected.inc(game=self.slug)
+            player.abort()
+            raise ConnectionResetError
+
+    def write_frame(self, frame, player=None):
+        """
+        Write a frame that only makes sense on top of the previous ones,
+        it's dropped if the player is behind
+        """
+        player = player or self.player
+        if player in self._stalled:
+            metrics.frames_dropped.inc(game=self.slug)
+            return
+        player.write(frame)
+
+    def redraw_frame(self, player):
+        """
+        The whole screen as it is now, for a player whose frames were
+        dropped
+        """
+        raise NotImplementedError
+
+    def read_input(self, player=None):
+        """
+        Everything the player sent since the last call
+        """
+        return (player or self.player).poll_keys()
+
+    def finish(self, exc=None):
+        """
+        End the game, exc is raised from run if given
+        """
+        if self._finished.done():
+            return
+        if exc is None:
+            self._finished.set_result(None)
+        else:
+            self._finished.set_exception(exc)
+
+    def on_start(self):
+        """
+        Called before the first tick, send the initial frame here
+        """
+        pass
+
+    def on_tick(self):
+        raise NotImplementedError
+
+    async def on_finish(self):
+        """
+        Called after the game ended without errors
+        """
+        pass
+
+
 class GenericQuestion:
     def __init__(self, prompt, answer):
         self.prompt = prompt
@@ -276,10 +513,7 @@ class GenericQuizGameBase(Game):
         """
         Attempt to read an answer, if none submitted, return None
         """
-        try:
-            return await self.player.readline(timeout=0.5)
-        except asyncio.TimeoutError:
-            return None
+        return await self.player.next_line(self.time + 0.5)
 
     async def clear_player_entry(self):
         """
@@ -311,3 +545,37 @@ class GenericQuizGame(StoreGamesWithResultMessageMixin, GenericQuizGameBase):
             f"correctly"
         )
 
+
+class QuestionBankQuizGame(GenericQuizGame):
+    """
+    Quiz played with questions_per_game random questions from the
+    question bank file at question_bank_path (see question_bank). The
+    next prefetch questions are read in a thread while the current ones
+    are played, so questions whose pages aren't in memory don't hold up
+    the event loop.
+    """
+
+    question_bank_path = None
+    questions_per_game = 25
+    prefetch = 5
+
+    def make_question(self, prompt, answer):
+        return GenericQuestion(prompt, answer)
+
+    async def iter_questions(self):
+        bank = get_question_bank(self.question_bank_path)
+        indexes = bank.sample(self.questions_per_game)
+        loop = asyncio.get_running_loop()
+        batches = [
+            indexes[start:start + self.prefetch]
+            for start in range(0, len(indexes), self.prefetch)
+        ]
+        if not batches:
+            return
+        pending = loop.run_in_executor(None, bank.read, batches[0])
+        for next_batch in batches[1:] + [None]:
+            questions = await pending
+            if next_batch is not None:
+                pending = loop.run_in_executor(None, bank.read, next_batch)
+            for prompt, answer in questions:
+                yield self.make_question(prompt, answer)
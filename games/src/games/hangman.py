@@ -1,12 +1,10 @@
 import asyncio
-import os
-import random
-import linecache
 import inspect
 from .. import cursor
 from ..game import (StoreGamesWithResultMessageMixin,
                     StoreGamesWithSnapshotMixin,
                     Game)
+from .word_bank import word_bank
 
 
 class HangmanBoard:
@@ -37,34 +35,44 @@ class HangmanBoard:
         f"{{description}}\n"
     )
 
+    # rows in board, wide enough for the longest names
+    height = 10
+    width = 100
+
     body_parts = {
         #  turn num: (x, y, symbol)
-        1: (8, 12, '0'),
-        2: (7, 12, '|'),
-        3: (7, 11, '/'),
-        4: (7, 13, '\\'),
-        5: (6, 11, '/'),
-        6: (6, 13, '\\')
+        1: (11, 2, '0'),
+        2: (11, 3, '|'),
+        3: (10, 3, '/'),
+        4: (12, 3, '\\'),
+        5: (10, 4, '/'),
+        6: (12, 4, '\\')
     }
 
     @classmethod
-    def draw_body_part(cls, part: int, color=cursor.yellow):
+    def make_screen(cls):
+        screen = cursor.Screen(cls.width, cls.height)
+        screen.put(0, 0, cls.board)
+        return screen
+
+    @classmethod
+    def draw_body_part(cls, screen, part: int, color=cursor.yellow):
         x, y, char = cls.body_parts[part]
-        return cursor.replace_relative(x, y, color(char))
+        screen.put(x, y, color(char))
 
     @classmethod
-    def draw_word(cls, word: str):
-        out = f'{cursor.ERASE_TO_LINE_END}{word}'
-        return cursor.replace_relative(5, 18, out)
+    def draw_word(cls, screen, word: str):
+        screen.clear_to_end(17, 5)
+        screen.put(17, 5, word)
 
     @classmethod
-    def draw_letters(cls, letters: str):
-        out = f'{cursor.ERASE_TO_LINE_END}{letters}'
-        return cursor.replace_relative(7, 26, out)
+    def draw_letters(cls, screen, letters: str):
+        screen.clear_to_end(25, 3)
+        screen.put(25, 3, letters)
 
     @classmethod
-    def draw_result(cls, result):
-        return cursor.replace_relative(3, 26, result)
+    def draw_result(cls, screen, result):
+        screen.put(25, 7, result)
 
 
 class Hangman(StoreGamesWithResultMessageMixin,
@@ -78,7 +86,7 @@ class Hangman(StoreGamesWithResultMessageMixin,
     icon = "dizzy"
     center_snapshot = False
     bold_snapshot = False
-    wordlist = f"{os.path.dirname(__file__)}/wordlist.txt"
+    wordlist = word_bank.path
     frame_delay = 0.3
 
     def __init__(self, *args):
@@ -87,18 +95,10 @@ class Hangman(StoreGamesWithResultMessageMixin,
         self.missed_letters = []
         self.word, self.description = self.get_random_word()
         self.guess_word = self.prepare_guess_word(self.word)
+        self.screen = HangmanBoard.make_screen()
 
     def get_random_word(self):
-        # should read this into memory
-        idx = random.randint(0, 986)
-        w, d = linecache.getline(self.wordlist, idx).split(' | ')
-        return w, self.wrap_description(d)
-
-    def wrap_description(self, description):
-        ret = ''
-        for i in range(0, len(description) // 60):
-            ret += description[i*60: (i+1)*60] + '\n'
-        return ret
+        return word_bank.random_entry()
 
     def prepare_guess_word(self, word):
         return [
@@ -122,10 +122,8 @@ class Hangman(StoreGamesWithResultMessageMixin,
         return len(self.missed_letters)
 
     def initial_frame(self):
-        return (
-            f'{HangmanBoard.board}'
-            f'{HangmanBoard.draw_word(self.display_guess_word)}'
-        )
+        HangmanBoard.draw_word(self.screen, self.display_guess_word)
+        return self.screen.draw()
 
     def update_guess_word(self, choice):
         for idx, c in enumerate(self.word):
@@ -189,18 +187,22 @@ class Hangman(StoreGamesWithResultMessageMixin,
             cursor.yellow(c) if c.lower() == choice else c
             for c in self.guess_word
         ]
-        yield HangmanBoard.draw_word(' '.join(tmp))
+        HangmanBoard.draw_word(self.screen, ' '.join(tmp))
+        yield self.screen.render()
         await asyncio.sleep(self.frame_delay)
-        yield HangmanBoard.draw_word(self.display_guess_word)
+        HangmanBoard.draw_word(self.screen, self.display_guess_word)
+        yield self.screen.render()
 
     async def on_already_missed(self, choice):
         tmp = [
             cursor.yellow(c) if c == choice else c
             for c in self.missed_letters
         ]
-        yield HangmanBoard.draw_letters(', '.join(tmp))
+        HangmanBoard.draw_letters(self.screen, ', '.join(tmp))
+        yield self.screen.render()
         await asyncio.sleep(self.frame_delay)
-        yield HangmanBoard.draw_letters(self.display_missed_letters)
+        HangmanBoard.draw_letters(self.screen, self.display_missed_letters)
+        yield self.screen.render()
 
     async def on_correct_guess(self, choice):
         self.update_guess_word(choice)
@@ -208,33 +210,35 @@ class Hangman(StoreGamesWithResultMessageMixin,
             cursor.green(c) if c.lower() == choice else c
             for c in self.guess_word
         ]
-        yield HangmanBoard.draw_word(' '.join(tmp))
+        HangmanBoard.draw_word(self.screen, ' '.join(tmp))
+        yield self.screen.render()
         await asyncio.sleep(self.frame_delay)
-        yield HangmanBoard.draw_word(self.display_guess_word)
+        HangmanBoard.draw_word(self.screen, self.display_guess_word)
+        yield self.screen.render()
 
     async def on_incorrect_guess(self, choice):
         tmp = ', '.join([*self.missed_letters, cursor.red(choice)])
         self.missed_letters.append(choice)
-        yield HangmanBoard.draw_letters(tmp) +\
-            HangmanBoard.draw_body_part(self.misses, color=cursor.red)
+        HangmanBoard.draw_letters(self.screen, tmp)
+        HangmanBoard.draw_body_part(self.screen, self.misses, color=cursor.red)
+        yield self.screen.render()
         await asyncio.sleep(self.frame_delay)
-        yield HangmanBoard.draw_letters(self.display_missed_letters) +\
-            HangmanBoard.draw_body_part(self.misses)
+        HangmanBoard.draw_letters(self.screen, self.display_missed_letters)
+        HangmanBoard.draw_body_part(self.screen, self.misses)
+        yield self.screen.render()
 
     def on_loss(self):
         word = cursor.red(' '.join(list(self.word)))
-        return (
-            f"{HangmanBoard.draw_word(word)}"
-            f"{HangmanBoard.draw_result(cursor.red('HANGED'))}"
-        )
+        HangmanBoard.draw_word(self.screen, word)
+        HangmanBoard.draw_result(self.screen, cursor.red('HANGED'))
+        return self.screen.render()
 
     async def on_win(self):
         await self.player.on_earned_points(20 - self.misses)
         word = cursor.green(' '.join(list(self.word)))
-        return (
-            f"{HangmanBoard.draw_word(word)}"
-            f"{HangmanBoard.draw_result(cursor.green('SPARED'))}"
-        )
+        HangmanBoard.draw_word(self.screen, word)
+        HangmanBoard.draw_result(self.screen, cursor.green('SPARED'))
+        return self.screen.render()
 
     def make_result_message_for(self, player):
         if self.misses < 6:
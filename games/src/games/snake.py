@@ -1,8 +1,10 @@
-import asyncio
+import array
+import itertools
 import random
+from collections import deque
 from .. import cursor
 from ..game import (
-    Game,
+    RealTimeGame,
     PromptForEmojiSupportMixin,
     StoreGamesWithSnapshotMixin,
     StoreGamesWithResultMessageMixin,
@@ -15,6 +17,9 @@ class BoardMeta(type):
         board.PAD = " " * board.PADDING
         board.ALL_CELLS = board.make_all_cells()
         board.EMPTY_BOARD_FORMAT = cls.make_empty_board_format(board)
+        # score line, walls and the cells, the cursor parks below
+        board.SCREEN_HEIGHT = board.HEIGHT + 3
+        board.SCREEN_WIDTH = board.PADDING + (board.WIDTH + 2) * len(board.EMPTY_CELL)
         return board
 
     @classmethod
@@ -42,7 +47,7 @@ class AsciiBoard(metaclass=BoardMeta):
     FOODS = [cursor.red("*"), cursor.green("%"), cursor.magenta("&")]
     TREES = [cursor.blue("+")]
     SCORE_MESSAGE = "Score: "
-    X_MOD = 1
+    SCORE_COLUMN = PADDING + len(SCORE_MESSAGE)
 
     @classmethod
     def make_all_cells(cls):
@@ -54,23 +59,19 @@ class AsciiBoard(metaclass=BoardMeta):
         return cls.EMPTY_BOARD_FORMAT.format(random.choice(cls.TREES))
 
     @classmethod
-    def save_cursor_state(cls, message):
-        return f"{cursor.HOME}{cursor.SAVE}" f"{message}" f"{cursor.RESTORE}"
+    def make_screen(cls):
+        screen = cursor.Screen(cls.SCREEN_WIDTH, cls.SCREEN_HEIGHT)
+        screen.put(0, 0, cls.make_empty_board())
+        return screen
 
     @classmethod
-    def replace_cell(cls, x, y, val):
-        cell_size = len(cls.EMPTY_CELL)
-        x_offset = x * cell_size + cls.PADDING + cls.X_MOD
-        return cls.save_cursor_state(
-            f"{cursor.up(cls.HEIGHT + 1 - y)}"
-            f"{cursor.move_to_column(x_offset)}"
-            f"{val}"
-        )
+    def replace_cell(cls, screen, x, y, val):
+        # past the padding and the left wall
+        screen.put(cls.PADDING + (x + 1) * len(cls.EMPTY_CELL), y + 2, val)
 
     @classmethod
-    def replace_score(cls, score):
-        x = len(cls.SCORE_MESSAGE)
-        return cls.replace_cell(x, -2, score)
+    def replace_score(cls, screen, score):
+        screen.put(cls.SCORE_COLUMN, 0, str(score))
 
     @classmethod
     def make_snapshot_from_state(cls, snake, food=None):
@@ -80,11 +81,12 @@ class AsciiBoard(metaclass=BoardMeta):
         ]
         head_x, head_y = snake[0]
         board[head_y][head_x] = AsciiBoard.HEAD
-        for x, y in snake[1:]:
+        for x, y in itertools.islice(snake, 1, None):
             board[y][x] = AsciiBoard.BODY
 
-        x, y, _ = food
-        board[y][x] = random.choice(AsciiBoard.FOODS)
+        if food is not None:
+            x, y, _ = food
+            board[y][x] = random.choice(AsciiBoard.FOODS)
 
         board_body = "\n".join([f'{wall}{"".join(row)}{wall}' for row in board])
 
@@ -110,21 +112,98 @@ class EmojiBoard(AsciiBoard):
         "\U0001F335",  # cactus
     ]
     SCORE_MESSAGE = "\U0001F480"  # skull
+    SCORE_COLUMN = AsciiBoard.PADDING + 4
     EMPTY_CELL = "  "
-    X_MOD = 3
+
+
+class SnakeBody:
+    """
+    The cells a snake covers, head first, kept so that every move is
+    O(1) whatever the length of the snake or the size of the board: a
+    deque of the cells, a bitmap of the occupied ones and an array of
+    the free ones, where a cell is removed by swapping the last one into
+    its place (free_index is where each cell is in free).
+    """
+
+    def __init__(self, width, height, cells):
+        self.width = width
+        size = width * height
+        self.cells = deque()
+        # how many times each cell is covered, more than once only when
+        # a move into the body wasn't treated as a crash
+        self.occupied = bytearray(size)
+        self.free = array.array("i", range(size))
+        self.free_index = array.array("i", range(size))
+        for cell in cells:
+            self.cells.append(cell)
+            self._take(cell)
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __iter__(self):
+        return iter(self.cells)
+
+    def __getitem__(self, idx):
+        return self.cells[idx]
+
+    def __contains__(self, cell):
+        x, y = cell
+        return self.occupied[y * self.width + x] > 0
+
+    def push_head(self, cell):
+        self.cells.appendleft(cell)
+        self._take(cell)
+
+    def pop_tail(self):
+        cell = self.cells.pop()
+        self._release(cell)
+        return cell
+
+    def random_free_cell(self):
+        """
+        A cell the snake doesn't cover, None if there are none left
+        """
+        if not self.free:
+            return None
+        idx = self.free[random.randrange(len(self.free))]
+        return idx % self.width, idx // self.width
+
+    def _take(self, cell):
+        x, y = cell
+        idx = y * self.width + x
+        self.occupied[idx] += 1
+        if self.occupied[idx] > 1:
+            return
+        # swap the last free cell into its place
+        pos = self.free_index[idx]
+        last = self.free[-1]
+        self.free[pos] = last
+        self.free_index[last] = pos
+        self.free.pop()
+
+    def _release(self, cell):
+        x, y = cell
+        idx = y * self.width + x
+        self.occupied[idx] -= 1
+        if self.occupied[idx]:
+            return
+        self.free_index[idx] = len(self.free)
+        self.free.append(idx)
 
 
 class Snake(
     StoreGamesWithSnapshotMixin,
     StoreGamesWithResultMessageMixin,
     PromptForEmojiSupportMixin,
-    Game,
+    RealTimeGame,
 ):
     name = "Snake"
     player_count = 1
     icon = "dragon"
 
-    delay = 0.17
+    tick_interval = 0.17
+    max_pending_keys = 3
     welcome_message = (
         f"{cursor.CLEAR}"
         f"{cursor.YELLOW}Make sure to run this game 'real-time' (-i)\n"
@@ -139,9 +218,15 @@ class Snake(
     def __init__(self, *args):
         super().__init__(*args)
         self.board = EmojiBoard if self.player.emoji_support else AsciiBoard
-        self.snake = [(self.board.WIDTH // 2, self.board.HEIGHT // 10)]
+        self.snake = SnakeBody(
+            self.board.WIDTH,
+            self.board.HEIGHT,
+            [(self.board.WIDTH // 2, self.board.HEIGHT // 10)],
+        )
         self.direction = (1, 0)
         self.food = None
+        self.pending_keys = ""
+        self.screen = self.board.make_screen()
         self.spawn_food()
 
     @classmethod
@@ -150,55 +235,66 @@ class Snake(
         Let the player know the best way to play before
         queuing them for the game
         """
-        await player.send(cls.welcome_message)
+        if player.preamble.get("realtime") != "1":
+            await player.send(cls.welcome_message)
         await super().on_player_connected(player)
 
-    async def run(self):
-        await self.player.send(self.initial_frame())
-        async for frame in self.iter_frames():
-            await self.player.send(frame)
-            waited = await self._input_opportunity()
-            await asyncio.sleep(self.delay - waited)
+    def on_start(self):
+        self.player.write(self.initial_frame())
+
+    def on_tick(self):
+        # one turn per tick, later keys wait for the next ticks
+        keys = self.pending_keys + self.read_input()
+        keys = keys[-self.max_pending_keys:]
+        while keys:
+            key, keys = keys[0], keys[1:]
+            if self.change_direction(key):
+                break
+        self.pending_keys = keys
+
+        frame = self.next_frame()
+        if frame is None:
+            self.finish()
+        else:
+            self.write_frame(frame)
+
+    async def on_finish(self):
         await self.player.send(self.game_over)
 
-    async def _input_opportunity(self):
-        try:
-            start = self.time
-            inp = await self.player.read(8, timeout=self.delay)
-            self.change_direction(inp[0])
-            return self.time - start
-        except asyncio.TimeoutError:
-            return self.delay
-
-    async def iter_frames(self):
-        while True:
-            new_head = self.get_next_head()
-
-            if self.check_game_over(new_head):
-                return
-
-            frame = (
-                f"{self.board.replace_cell(*new_head, self.board.HEAD)}"
-                f"{self.board.replace_cell(*self.snake[0], self.board.BODY)}"
-            )
-
-            self.snake.insert(0, new_head)
-            eats_food = self.check_eats_food(new_head)
-
-            if eats_food:
-                self.spawn_food()
-                await self.player.on_earned_points(1)
-                frame += self.board.replace_cell(*self.food)
-                frame += self.board.replace_score(self.player.earned)
-            else:
-                old_tail = self.snake.pop()
-                frame += self.board.replace_cell(*old_tail, self.board.EMPTY_CELL)
-            yield frame
+    def next_frame(self):
+        """
+        Move the snake, returns None when it crashed
+        """
+        new_head = self.get_next_head()
+
+        if self.check_game_over(new_head):
+            return None
+
+        board, screen = self.board, self.screen
+        board.replace_cell(screen, *new_head, board.HEAD)
+        board.replace_cell(screen, *self.snake[0], board.BODY)
+
+        self.snake.push_head(new_head)
+        eats_food = self.check_eats_food(new_head)
+
+        if eats_food:
+            self.spawn_food()
+            self.player.add_points(1)
+            if self.food is not None:
+                board.replace_cell(screen, *self.food)
+            board.replace_score(screen, self.player.earned)
+        else:
+            old_tail = self.snake.pop_tail()
+            board.replace_cell(screen, *old_tail, board.EMPTY_CELL)
+        return screen.render()
 
     def initial_frame(self):
-        return (
-            f"{self.board.make_empty_board()}" f"{self.board.replace_cell(*self.food)}"
-        )
+        if self.food is not None:
+            self.board.replace_cell(self.screen, *self.food)
+        return self.screen.draw()
+
+    def redraw_frame(self, player):
+        return self.screen.redraw()
 
     def get_next_head(self):
         return (
@@ -207,12 +303,15 @@ class Snake(
         )
 
     def spawn_food(self):
-        # pylint: disable=no-member
-        cell = random.choice(list(self.board.ALL_CELLS - set(self.snake)))
+        cell = self.snake.random_free_cell()
+        if cell is None:
+            # the snake fills the board
+            self.food = None
+            return
         self.food = (*cell, random.choice(self.board.FOODS))
 
     def check_eats_food(self, new_head):
-        return new_head == self.food[:2]
+        return self.food is not None and new_head == self.food[:2]
 
     def check_game_over(self, new_head):
         x, y = new_head
@@ -220,14 +319,14 @@ class Snake(
             return True
         if not 0 <= y <= self.board.HEIGHT - 1:
             return True
-        for cell in self.snake:
-            if cell == new_head:
-                return True
-        return False
+        # the tail hasn't moved out of the way yet
+        return new_head in self.snake
 
     def change_direction(self, inp):
         if inp in self.valid_directions[self.direction]:
             self.direction = self.directions[inp]
+            return True
+        return False
 
     def make_final_snapshot(self):
         return self.board.make_snapshot_from_state(self.snake, self.food)
@@ -1,88 +1,180 @@
+"""
+Subnet Racer questions come from a shared pool that's refilled a batch
+at a time, the answers are worked out with integer math on the 32 bit
+addresses and masks of a whole batch at once. numpy does the batch when
+it's installed, it's optional, the same math runs in plain python
+otherwise.
+"""
+import os
 import random
-import ipaddress
-import itertools
+from array import array
 from ..game import GenericQuizGame, GenericQuestion
 
-# use np.random.choice(..., p=WEIGHTS) instead?
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 WEIGHTS = [0, 0, 0, 0, 1, 1, 1, 1,  # 1st octet
            4, 1, 1, 1, 1, 1, 1, 1,  # 2nd octet
            4, 1, 1, 1, 1, 2, 2, 2,  # 3rd octet
            6, 3, 3, 3, 3, 3, 1, 0]  # 4th octet
-CIDRS = list(itertools.chain(*[
-    [idx for _ in range(WEIGHTS[idx])]
-    for idx in range(0, 32)
-]))
-
-
-def broadcast_question(host, cidr):
-    network = ipaddress.IPv4Network(f"{host}/{cidr}", strict=False)
-    return (
-        f"What is the broadcast address in the network {host}/{cidr}?",
-        f"{network.broadcast_address}"
-    )
-
-
-def network_id_question(host, cidr):
-    network = ipaddress.IPv4Network(f"{host}/{cidr}", strict=False)
-    return (
-        f"What is the network address for the network {host}/{cidr}?",
-        f"{network.network_address}"
-    )
-
-
-def subnet_mask_question(host, cidr):
-    network = ipaddress.IPv4Network(f"{host}/{cidr}", strict=False)
-    return (
-        f"what is the subnet mask for the cidr /{cidr}?",
-        f"{network.netmask}"
-    )
-
-
-def first_host_question(host, cidr):
-    if cidr > 30:
-        cidr = 30
-    network = ipaddress.IPv4Network(f"{host}/{cidr}", strict=False)
-    return (
-        f"What is the first usable host in the network {host}/{cidr}?",
-        f"{network.network_address + 1}"
-    )
 
-
-def last_host_question(host, cidr):
-    if cidr > 30:
-        cidr = 30
-    network = ipaddress.IPv4Network(f"{host}/{cidr}", strict=False)
-    return (
-        f"What is the last usable host in the network {host}/{cidr}?",
-        f"{network.broadcast_address - 1}"
-    )
+# question kinds, in the order of PROMPTS
+BROADCAST, NETWORK_ID, SUBNET_MASK, FIRST_HOST, LAST_HOST, USABLE_HOSTS = range(6)
+PROMPTS = [
+    "What is the broadcast address in the network {host}/{cidr}?",
+    "What is the network address for the network {host}/{cidr}?",
+    "what is the subnet mask for the cidr /{cidr}?",
+    "What is the first usable host in the network {host}/{cidr}?",
+    "What is the last usable host in the network {host}/{cidr}?",
+    "How many usable hosts are in the network {host}/{cidr}?",
+]
+# questions about usable hosts ask about a /30 instead of a /31 or /32
+MAX_HOSTS_CIDR = 30
+ALL_ONES = 0xFFFFFFFF
 
 
-def num_usable_hosts_question(host, cidr):
-    if cidr > 30:
-        cidr = 30
+def format_address(address):
     return (
-        f"How many usable hosts are in the network {host}/{cidr}?",
-        f"{2**(32-cidr) - 2}"
+        f"{address >> 24}.{(address >> 16) & 255}."
+        f"{(address >> 8) & 255}.{address & 255}"
     )
 
 
-QUESTION_TYPES = [
-    broadcast_question,
-    network_id_question,
-    subnet_mask_question,
-    first_host_question,
-    last_host_question,
-    num_usable_hosts_question
-]
+class QuestionPool:
+    """
+    size questions at a time kept in preallocated arrays: the host, the
+    cidr asked about, the kind of question and its answer as an integer.
+    Drawing a question only formats its strings.
+    """
+
+    def __init__(self, size=4096, use_numpy=numpy is not None):
+        self.size = size
+        self.use_numpy = use_numpy
+        self._rng = None  # made on the first refill, see after_fork
+        if use_numpy:
+            self._cidr_p = numpy.array(WEIGHTS) / sum(WEIGHTS)
+            self.hosts = numpy.empty(size, numpy.uint64)
+            self.cidrs = numpy.empty(size, numpy.uint64)
+            self.kinds = numpy.empty(size, numpy.uint8)
+            self.answers = numpy.empty(size, numpy.uint64)
+        else:
+            self.hosts, self.cidrs, self.answers = (
+                array("Q", bytes(8 * size)) for _ in range(3)
+            )
+            self.kinds = array("B", bytes(size))
+        self._next = size  # nothing generated yet
+
+    def __len__(self):
+        return self.size - self._next
+
+    def draw(self):
+        """
+        (prompt, answer) of the next question
+        """
+        if self._next == self.size:
+            self.refill()
+        idx = self._next
+        self._next += 1
+        host = int(self.hosts[idx])
+        cidr = int(self.cidrs[idx])
+        kind = int(self.kinds[idx])
+        answer = int(self.answers[idx])
+        prompt = PROMPTS[kind].format(host=format_address(host), cidr=cidr)
+        if kind == USABLE_HOSTS:
+            return prompt, str(answer)
+        return prompt, format_address(answer)
+
+    def refill(self):
+        """
+        Replace the whole pool with new random questions
+        """
+        if self.use_numpy:
+            if self._rng is None:
+                self._rng = numpy.random.default_rng()
+            rng = self._rng
+            hosts = rng.integers(0, ALL_ONES, self.size, endpoint=True)
+            cidrs = rng.choice(len(WEIGHTS), self.size, p=self._cidr_p)
+            kinds = rng.integers(0, len(PROMPTS), self.size)
+        else:
+            hosts = [random.getrandbits(32) for _ in range(self.size)]
+            cidrs = random.choices(range(len(WEIGHTS)), WEIGHTS, k=self.size)
+            kinds = [random.randrange(len(PROMPTS)) for _ in range(self.size)]
+        self.fill(hosts, cidrs, kinds)
+
+    def after_fork(self):
+        """
+        A forked worker would deal the same questions as its parent and
+        the other workers, it starts over with a generator of its own
+        """
+        self._rng = None
+        self._next = self.size
+
+    def fill(self, hosts, cidrs, kinds):
+        """
+        Put these questions in the pool (size of them), answers are
+        worked out here
+        """
+        if not len(hosts) == len(cidrs) == len(kinds) == self.size:
+            raise ValueError(f"expected {self.size} questions")
+        if self.use_numpy:
+            self._fill_numpy(hosts, cidrs, kinds)
+        else:
+            self._fill_python(hosts, cidrs, kinds)
+        self._next = 0
+
+    def _fill_numpy(self, hosts, cidrs, kinds):
+        self.hosts[:] = hosts
+        self.kinds[:] = kinds
+        self.cidrs[:] = cidrs
+        cidrs = self.cidrs
+        numpy.minimum(
+            cidrs, MAX_HOSTS_CIDR, out=cidrs, where=self.kinds >= FIRST_HOST
+        )
+        # 64 bits wide so a /0 shifts all the ones out
+        mask = (ALL_ONES << (32 - cidrs)) & ALL_ONES
+        network = self.hosts & mask
+        broadcast = network | (mask ^ ALL_ONES)
+        numpy.choose(
+            self.kinds,
+            [
+                broadcast,
+                network,
+                mask,
+                network + 1,
+                broadcast - 1,
+                (1 << (32 - cidrs)) - 2,
+            ],
+            out=self.answers,
+        )
+
+    def _fill_python(self, hosts, cidrs, kinds):
+        self.hosts[:] = array("Q", hosts)
+        self.kinds[:] = array("B", kinds)
+        for idx, (host, cidr, kind) in enumerate(zip(hosts, cidrs, kinds)):
+            if kind >= FIRST_HOST:
+                cidr = min(cidr, MAX_HOSTS_CIDR)
+            mask = (ALL_ONES << (32 - cidr)) & ALL_ONES
+            network = host & mask
+            broadcast = network | (mask ^ ALL_ONES)
+            self.cidrs[idx] = cidr
+            self.answers[idx] = (
+                broadcast,
+                network,
+                mask,
+                network + 1,
+                broadcast - 1,
+                (1 << (32 - cidr)) - 2,
+            )[kind]
+
+
+question_pool = QuestionPool()
+os.register_at_fork(after_in_child=question_pool.after_fork)
 
 
 def get_question():
-    octets = [str(random.randint(0, 255)) for _ in range(4)]
-    host = ".".join(octets)
-    cidr = random.choice(CIDRS)
-    question_type = random.choice(QUESTION_TYPES)
-    return question_type(host, cidr)
+    return question_pool.draw()
 
 
 class SubnetRacer(GenericQuizGame):
@@ -97,5 +189,4 @@ class SubnetRacer(GenericQuizGame):
     async def iter_questions(self):
         for _ in range(25):
             prompt, answer = get_question()
-            print(answer)
             yield GenericQuestion(prompt, answer)
@@ -0,0 +1,202 @@
+"""
+Hangman's words and their descriptions, one `word | description` per
+line of a wordlist file.
+
+The file is mapped into memory and parsed once, only the offsets of
+each entry are kept along with the entries of every word length and
+difficulty, so a random entry is picked in O(1) however long the list
+is. The list is reloaded when the file changes, replace it by renaming
+a new file over it (editing it in place would change the mapped pages
+under the running server).
+"""
+import asyncio
+import mmap
+import os
+import random
+import re
+import time
+from array import array
+
+
+SEPARATOR = b" | "
+# word | description, a line without the separator is skipped
+ENTRY_RE = re.compile(rb"^([^\n]*?) \| [^\n]*", re.MULTILINE)
+NOT_ASCII_LETTERS = bytes(c for c in range(128) if not chr(c).isalpha())
+DESCRIPTION_WIDTH = 60
+
+
+def wrap_description(description, width=DESCRIPTION_WIDTH):
+    return "".join(
+        description[i:i + width] + "\n" for i in range(0, len(description), width)
+    )
+
+
+class WordList:
+    """
+    The parsed entries of one version of a wordlist file. An entry's
+    length is the number of letters to guess and its difficulty the
+    number of different letters among them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.by_length = {}  # length -> array of entry indexes
+        self.by_difficulty = {}
+        self._by_both = {}
+        self._starts = array("L")  # entry i is data[starts[i]:ends[i]]
+        self._separators = array("L")
+        self._ends = array("L")
+        with open(path, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            self._data = b""
+            if self.stat.st_size:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._parse()
+        if not self._starts:
+            self.close()
+            raise ValueError(f"no words in {path}")
+
+    def _parse(self):
+        starts, separators, ends = self._starts, self._separators, self._ends
+        by_length, by_difficulty, by_both = (
+            self.by_length, self.by_difficulty, self._by_both
+        )
+        for match in ENTRY_RE.finditer(self._data):
+            idx = len(starts)
+            starts.append(match.start())
+            separators.append(match.end(1))
+            ends.append(match.end())
+            word = match.group(1).lower()
+            if word.isascii():
+                letters = word.translate(None, NOT_ASCII_LETTERS)
+            else:
+                letters = [c for c in word.decode().lower() if c.isalpha()]
+            length, difficulty = len(letters), len(set(letters))
+            for index, key in (
+                (by_length, length),
+                (by_difficulty, difficulty),
+                (by_both, (length, difficulty)),
+            ):
+                entries = index.get(key)
+                if entries is None:
+                    entries = index[key] = array("L")
+                entries.append(idx)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __getitem__(self, idx):
+        """
+        (word, description wrapped to DESCRIPTION_WIDTH)
+        """
+        data = self._data
+        separator = self._separators[idx]
+        word = data[self._starts[idx]:separator].decode()
+        description = data[separator + len(SEPARATOR):self._ends[idx]].decode()
+        return word, wrap_description(description.strip())
+
+    def random_entry(self, length=None, difficulty=None):
+        """
+        A uniformly random entry, of the given length and/or difficulty
+        if any
+
+        Raises:
+            KeyError: if no word matches
+        """
+        if length is None and difficulty is None:
+            return self[random.randrange(len(self))]
+        if difficulty is None:
+            entries = self.by_length[length]
+        elif length is None:
+            entries = self.by_difficulty[difficulty]
+        else:
+            entries = self._by_both[length, difficulty]
+        return self[entries[random.randrange(len(entries))]]
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+
+class WordBank:
+    """
+    The current WordList of a file, every check_interval seconds the file
+    is checked for changes and a new version is parsed in a thread while
+    games keep using the old one.
+    """
+
+    def __init__(self, path, check_interval=5, clock=time.monotonic):
+        self.path = path
+        self.check_interval = check_interval
+        self.clock = clock
+        self._words = None
+        self._checked_at = None
+        self._reloading = None
+
+    @property
+    def words(self):
+        if self._words is None:
+            self._words = WordList(self.path)
+            self._checked_at = self.clock()
+        return self._words
+
+    def __len__(self):
+        return len(self.words)
+
+    def random_entry(self, length=None, difficulty=None):
+        """
+        See WordList.random_entry
+        """
+        self._check_for_changes()
+        return self.words.random_entry(length, difficulty)
+
+    def _check_for_changes(self):
+        if self._words is None or self._reloading is not None:
+            return
+        now = self.clock()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return
+        old = self._words.stat
+        if (stat.st_ino, stat.st_size, stat.st_mtime_ns) == (
+            old.st_ino, old.st_size, old.st_mtime_ns
+        ):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._replace(self._load())
+            return
+        self._reloading = loop.run_in_executor(None, self._load)
+        self._reloading.add_done_callback(self._on_reloaded)
+
+    def _load(self):
+        try:
+            return WordList(self.path)
+        except (OSError, ValueError) as e:
+            print(f"[!] failed to reload {self.path}: {e!r}")
+            return None
+
+    def _on_reloaded(self, future):
+        self._reloading = None
+        self._replace(future.result())
+
+    def _replace(self, words):
+        if words is None:
+            return
+        old, self._words = self._words, words
+        # entries are copied out of the mapping, nothing refers to it
+        old.close()
+        print(f"[+] loaded {len(words)} words from {self.path}")
+
+
+word_bank = WordBank(
+    os.environ.get(
+        "TERMNINJA_WORDLIST", os.path.join(os.path.dirname(__file__), "wordlist.txt")
+    ),
+    check_interval=float(os.environ.get("TERMNINJA_WORDLIST_CHECK_INTERVAL", 5)),
+)
@@ -0,0 +1,158 @@
+"""
+Hand a running games server's sockets to its replacement.
+
+The old process listens on a unix socket. When a new process starts
+with the same TERMNINJA_HANDOFF_SOCKET it connects and the two talk in
+length prefixed json messages with file descriptors attached
+(SCM_RIGHTS):
+
+    old -> new  listeners     fd of the listening socket
+    new -> old  ready         new process is accepting on it
+    old -> new  connections   fds of players at the token prompt or
+                              menu, with the stage they were at
+
+The listening socket is never closed in between, so connections queue
+in the kernel rather than being refused. The old process then drains
+its running games and exits.
+"""
+import array
+import json
+import os
+import socket
+import struct
+
+
+MAX_FDS = 250  # the kernel allows 253 (SCM_MAX_FD) per message
+HEADER = struct.Struct("!I")
+TIMEOUT = 10
+
+
+def send_message(sock, message, fds=()):
+    data = json.dumps(message).encode()
+    ancillary = []
+    if fds:
+        ancillary = [
+            (socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))
+        ]
+    sock.sendmsg([HEADER.pack(len(data)), data], ancillary)
+
+
+def recv_message(sock):
+    """
+    Returns (message, fds). The caller owns the received fds.
+    """
+    fds = array.array("i")
+    # only read the header with the first call so we never read into
+    # the next message, the fds arrive with the first byte
+    header, ancdata, _, _ = sock.recvmsg(
+        HEADER.size, socket.CMSG_SPACE(MAX_FDS * fds.itemsize)
+    )
+    for level, kind, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            usable = len(cmsg_data) - (len(cmsg_data) % fds.itemsize)
+            fds.frombytes(cmsg_data[:usable])
+    header += _recv_exactly(sock, HEADER.size - len(header))
+    (length,) = HEADER.unpack(header)
+    return json.loads(_recv_exactly(sock, length)), list(fds)
+
+
+def _recv_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionResetError("handoff peer disconnected")
+        data += chunk
+    return data
+
+
+def connect(path):
+    """
+    Connect to a running server's handoff socket. Returns None when
+    there is no server to take over from.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(TIMEOUT)
+    try:
+        sock.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    return sock
+
+
+def listen(path):
+    """
+    Listen for a replacement process. Any socket file left at path
+    belongs to the process we took over from (or a dead one).
+    """
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(1)
+    sock.setblocking(False)
+    return sock
+
+
+def take_over_listener(sock):
+    """
+    New process, step 1: receive the listening socket
+    """
+    message, fds = recv_message(sock)
+    if message.get("type") != "listeners" or not fds:
+        for fd in fds:
+            os.close(fd)
+        raise ConnectionError(f"unexpected handoff message {message!r}")
+    # only one listening socket is handed off, see HotRestartMixin
+    for fd in fds[1:]:
+        os.close(fd)
+    return socket.socket(fileno=fds[0])
+
+
+def take_over_connections(sock):
+    """
+    New process, step 2: tell the old process we are accepting and
+    receive [(socket, info), ...] for its idle connections
+    """
+    send_message(sock, {"type": "ready"})
+    connections = []
+    while True:
+        message, fds = recv_message(sock)
+        connections.extend(
+            (socket.socket(fileno=fd), info)
+            for fd, info in zip(fds, message.get("connections", []))
+        )
+        if not message.get("more"):
+            return connections
+
+
+def give_listener(sock, listener):
+    """
+    Old process, step 1: send the listening socket, returns once the
+    new process is accepting on it
+    """
+    send_message(sock, {"type": "listeners"}, [listener.fileno()])
+    message, fds = recv_message(sock)
+    for fd in fds:
+        os.close(fd)
+    if message.get("type") != "ready":
+        raise ConnectionError(f"unexpected handoff message {message!r}")
+
+
+def give_connections(sock, connections):
+    """
+    Old process, step 2: send [(socket, info), ...] in batches of MAX_FDS
+    """
+    batches = [
+        connections[i:i + MAX_FDS] for i in range(0, len(connections), MAX_FDS)
+    ] or [[]]
+    for idx, batch in enumerate(batches):
+        message = {
+            "type": "connections",
+            "connections": [info for _, info in batch],
+            "more": idx < len(batches) - 1,
+        }
+        send_message(sock, message, [s.fileno() for s, _ in batch])
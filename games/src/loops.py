@@ -0,0 +1,38 @@
+"""
+Event loop policies the games server can run under.
+
+uvloop is opt-in so the default server only needs the standard library
+event loop. It is imported lazily so it does not have to be installed
+unless it is asked for.
+"""
+import asyncio
+
+
+def _asyncio_policy():
+    return asyncio.DefaultEventLoopPolicy()
+
+
+def _uvloop_policy():
+    import uvloop
+
+    return uvloop.EventLoopPolicy()
+
+
+LOOP_POLICIES = {
+    "asyncio": _asyncio_policy,
+    "uvloop": _uvloop_policy,
+}
+
+
+def install_loop_policy(name):
+    """
+    Set the event loop policy for this process by name
+    """
+    try:
+        make_policy = LOOP_POLICIES[name]
+    except KeyError:
+        raise ValueError(
+            f"unknown loop policy {name!r}, "
+            f"expected one of {', '.join(LOOP_POLICIES)}"
+        )
+    asyncio.set_event_loop_policy(make_policy())
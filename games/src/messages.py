@@ -67,3 +67,21 @@ GENERIC_QUIZ_INTERMISSION_REPORT = (
     f"Points earned:  {{earned_points}}\n\n"
     f"{cursor.blue('Press enter to continue...')}"
 )
+
+
+#
+#   server is shutting down, sent to players still at the menu
+#
+SERVER_RESTARTING = cursor.yellow(
+    "\n\nThe server is restarting, reconnect in a moment.\n\n"
+)
+
+
+#
+#   server is shutting down, drawn over the input line of running games
+#
+SERVER_DRAINING_NOTICE = (
+    f"{cursor.SAVE}{cursor.HOME}{cursor.ERASE_TO_LINE_END}"
+    f"{cursor.yellow('The server is restarting, finish up your game!')}"
+    f"{cursor.RESTORE}"
+)
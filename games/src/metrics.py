@@ -0,0 +1,241 @@
+"""
+Counters, gauges and histograms exposed in the Prometheus text format
+over a small http endpoint in each games process.
+"""
+import asyncio
+import bisect
+
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+DURATION_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+BYTES_BUCKETS = (64, 256, 1024, 4096, 16384, 65536)
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _escape(value):
+    value = str(value).replace("\\", "\\\\")
+    return value.replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labels)
+
+    def _sample(self, key, value):
+        return f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield self._sample(key, value)
+
+
+class Gauge(Metric):
+    """
+    Pass fn to read the value when scraped instead of setting it
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), fn=None, **kwargs):
+        super().__init__(name, help, labels, **kwargs)
+        self.fn = fn
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.fn is not None:
+            yield self._sample((), self.fn())
+            return
+        for key, value in self._values.items():
+            yield self._sample(key, value)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS, **kwargs):
+        super().__init__(name, help, labels, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # per bucket counts (+Inf last), sum
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def samples(self):
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield (
+                    f"{self.name}_bucket{_format_labels(self.labels, key, le)} "
+                    f"{cumulative}"
+                )
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+async def _handle_scrape(reader, writer, registry):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        while True:
+            # headers don't matter
+            header = await asyncio.wait_for(reader.readline(), 5)
+            if header in (b"\r\n", b"\n", b""):
+                break
+        parts = request_line.decode(errors="replace").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1] == "/metrics":
+            status, body = "200 OK", registry.render().encode()
+        else:
+            status, body = "404 Not Found", b""
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(host, port, registry=REGISTRY):
+    return await asyncio.start_server(
+        lambda r, w: _handle_scrape(r, w, registry), host, port
+    )
+
+
+#
+#   games server metrics
+#
+connections_active = Gauge(
+    "termninja_connections_active", "Open player connections"
+)
+throttled_connections = Counter(
+    "termninja_throttled_connections_total", "Connections rejected by the throttle"
+)
+handshake_seconds = Histogram(
+    "termninja_handshake_seconds", "Time from connecting to choosing a game"
+)
+game_sessions = Counter(
+    "termninja_game_sessions_total", "Games started", labels=("game",)
+)
+game_duration_seconds = Histogram(
+    "termninja_game_duration_seconds",
+    "How long games last",
+    labels=("game",),
+    buckets=DURATION_BUCKETS,
+)
+send_drain_seconds = Histogram(
+    "termninja_send_drain_seconds", "Time Player.send waits for the write buffer"
+)
+output_bytes_per_flush = Histogram(
+    "termninja_output_bytes_per_flush",
+    "Bytes per write to the transport, averaged per connection",
+    buckets=BYTES_BUCKETS,
+)
+output_writes_per_flush = Histogram(
+    "termninja_output_writes_per_flush",
+    "Messages coalesced into each write, averaged per connection",
+    buckets=COUNT_BUCKETS,
+)
+frames_dropped = Counter(
+    "termninja_frames_dropped_total",
+    "Real-time frames dropped for clients that fell behind",
+    labels=("game",),
+)
+slow_clients_disconnected = Counter(
+    "termninja_slow_clients_disconnected_total",
+    "Clients disconnected for staying behind too long",
+    labels=("game",),
+)
+play_token_lookups = Counter(
+    "termninja_play_token_lookups_total",
+    "Play token lookups by cache result",
+    labels=("result",),
+)
+round_write_seconds = Histogram(
+    "termninja_round_write_seconds", "Latency of storing a batch of rounds"
+)
+rounds_written = Counter(
+    "termninja_rounds_written_total", "Played rounds stored in the database"
+)
+rounds_journaled = Counter(
+    "termninja_rounds_journaled_total", "Played rounds spilled to the journal"
+)
+rounds_rejected = Counter(
+    "termninja_rounds_rejected_total",
+    "Played rounds the database rejected, moved to the dead letter file",
+)
+rounds_lost = Counter(
+    "termninja_rounds_lost_total", "Played rounds that could not be stored"
+)
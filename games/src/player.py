@@ -1,5 +1,11 @@
 import asyncio
+import codecs
+import collections
 import datetime
+import socket
+import time
+from . import metrics
+from .preamble import parse_preamble
 
 
 anonymous_identity = {
@@ -9,6 +15,13 @@ anonymous_identity = {
 }
 
 
+# input held per connection, past this the client is treated as gone
+# (asyncio.StreamReader's default limit)
+MAX_BUFFERED_INPUT = 2 ** 16
+# buffered output, ours and the transport's, past which send drains
+OUTPUT_HIGH_WATER = 2 ** 16
+
+
 def format_timedelta(delta):
     total_seconds = delta.total_seconds()
     hours = total_seconds // (60 * 60)
@@ -22,6 +35,14 @@ class Player:
     """
     Wraps the standard StreamReader, StreamWriter for more
     concise api for these types of applications.
+
+    Input is read by a single task per connection into a queue of keys,
+    the read methods take from that queue instead of reading the stream
+    themselves, so polling for input doesn't need a task or wait_for.
+
+    Output is buffered and written to the transport once per event loop
+    iteration, so everything sent during a tick (or by one step of a
+    coroutine) goes out in a single write.
     """
 
     def __init__(self,
@@ -37,7 +58,24 @@ class Player:
         self.total_score = 0
         self.earned = 0
         self.emoji_support = True
+        self.preamble = {}
+        self.has_preamble = False  # a bare version tag has no fields
         self._play_token_expires_at = None
+        self._closed = False
+        self._keys = collections.deque()  # decoded input, one char each
+        self._lines = 0  # newlines in _keys
+        self._eof = False
+        self._reading = None
+        self._waiter = None
+        self._output = []
+        self._output_size = 0  # characters in _output
+        self._flush_handle = None
+        # per connection counters, see close
+        self.bytes_sent = 0
+        self.writes = 0  # calls to send and write
+        self.flushes = 0  # writes to the transport
+        self._set_nodelay()
+        metrics.connections_active.inc()
 
     @property
     def play_token_expires_at(self):
@@ -63,32 +101,158 @@ class Player:
         self.total_score = user['total_score']
         self.identity = user
 
+    def apply_preamble(self, line):
+        """
+        If line is a connection preamble (and there hasn't been one
+        already) store its fields and return True
+        """
+        if self.has_preamble:
+            return False
+        preamble = parse_preamble(line)
+        if preamble is None:
+            return False
+        self.has_preamble = True
+        self.preamble = preamble
+        if 'emoji' in preamble:
+            self.emoji_support = not preamble['emoji'].lower().startswith('n')
+        return True
+
     async def send(self, msg: str):
         """
-        encode and send message and wait until
-        appropriate to call send again
+        buffer message to be sent, only waits if there's too much
+        output the client hasn't taken yet
 
         Args:
             msg (str): non-encoded message to be sent
+
+        Raises:
+            ConnectionResetError: if the connection is gone
         """
-        self.writer.write(msg.encode())
+        if self.writer.transport.is_closing():
+            raise ConnectionResetError
+        self.write(msg)
+        if self.output_backlog < OUTPUT_HIGH_WATER:
+            return
+        self.flush()
+        start = time.perf_counter()
         await self.writer.drain()
+        metrics.send_drain_seconds.observe(time.perf_counter() - start)
+
+    def write(self, msg: str):
+        """
+        buffer message without waiting for it to be sent, for callers
+        that can't await (see RealTimeGame)
+        """
+        self._output.append(msg)
+        self._output_size += len(msg)
+        self.writes += 1
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_event_loop().call_soon(self.flush)
+
+    @property
+    def output_backlog(self):
+        """
+        output buffered here and in the transport, not sent yet
+        """
+        return self._output_size + self.writer.transport.get_write_buffer_size()
+
+    def flush(self):
+        """
+        encode and write everything buffered to the transport
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._output:
+            return
+        data = ''.join(self._output).encode()
+        self._output.clear()
+        self._output_size = 0
+        if self.writer.transport.is_closing():
+            return
+        self.writer.write(data)
+        self.bytes_sent += len(data)
+        self.flushes += 1
+
+    @property
+    def disconnected(self):
+        """
+        the connection is gone, what was already received can still be read
+        """
+        return self._eof
+
+    def poll_key(self):
+        """
+        the next key received or None, doesn't wait
+
+        Raises:
+            ConnectionResetError: if nothing is left and the user disconnected
+        """
+        self._start_reading()
+        if not self._keys:
+            if self._eof:
+                raise ConnectionResetError
+            return None
+        key = self._keys.popleft()
+        if key == '\n':
+            self._lines -= 1
+        return key
+
+    def poll_keys(self):
+        """
+        everything received since the last call, doesn't wait
+        """
+        self._start_reading()
+        keys = ''.join(self._keys)
+        self._keys.clear()
+        self._lines = 0
+        return keys
+
+    def poll_line(self):
+        """
+        the next complete line with the newline stripped off or None,
+        doesn't wait
+        """
+        self._start_reading()
+        if not self._lines:
+            return None
+        return self._pop_line()
+
+    async def next_line(self, deadline=None):
+        """
+        wait for the next line
+
+        Args:
+            deadline (float): event loop time to give up at
+
+        Returns:
+            decoded input with newline stripped off, None if the
+            deadline passed first
+
+        Raises:
+            ConnectionResetError:
+                if the user disconnected while waiting
+        """
+        if not await self._wait_for_input(deadline, line=True):
+            return None
+        return self._pop_line()
 
     async def read_raw(self, size, timeout=None):
-        data = await asyncio.wait_for(
-            self.reader.read(size), timeout
-        )
-        if data == b'':
-            raise ConnectionResetError
-        return data.decode()
+        deadline = self._deadline(timeout)
+        if not await self._wait_for_input(deadline):
+            raise asyncio.TimeoutError
+        keys = self._keys
+        data = ''.join(keys.popleft() for _ in range(min(size, len(keys))))
+        self._lines -= data.count('\n')
+        return data
 
     async def read(self, size=8, timeout=None):
         """
-        attempt to read size bytes in timeout time
+        attempt to read size characters in timeout time
 
         Args:
             timeout (float): raise TimeoutError if exceeded
-            size (int): maximum number of bytes to read
+            size (int): maximum number of characters to read
 
         Returns:
             decoded input received
@@ -102,14 +266,9 @@ class Player:
 
     async def clear_input_buffer(self):
         """
-        read anything sitting in reader and throw it away
+        throw away anything received so far
         """
-        try:
-            await asyncio.wait_for(
-                self.reader.read(1024), 0.1
-            )
-        except asyncio.TimeoutError:
-            pass
+        self.poll_keys()
 
     async def readline(self, timeout=None):
         """
@@ -127,11 +286,10 @@ class Player:
             TimeoutError:
                 if timeout exceed while attempting read
         """
-        data = await asyncio.wait_for(self.reader.readline(),
-                                      timeout=timeout)
-        if data == b'' or not data.endswith(b'\n'):
-            raise ConnectionResetError()
-        return data.strip().decode()
+        line = await self.next_line(self._deadline(timeout))
+        if line is None:
+            raise asyncio.TimeoutError
+        return line
 
     async def read_until_valid(self,
                                validator,
@@ -154,36 +312,152 @@ class Player:
             asyncio.TimeoutError
 
         """
-        return await asyncio.wait_for(
-            self._readlines_until_validates(coerce, validator), timeout
-        )
+        deadline = self._deadline(timeout)
+        while True:
+            line = await self.next_line(deadline)
+            if line is None:
+                raise asyncio.TimeoutError
+            try:
+                data = coerce(line)
+                if validator(data):
+                    return data
+            except ValueError:
+                continue
 
     async def on_earned_points(self, earned):
         """
         Whenever the player earns points, update the players total score
         and their earned points for this round
         """
+        self.add_points(earned)
+
+    def add_points(self, earned):
         self.earned += earned
         self.total_score += earned
 
-    async def _readlines_until_validates(self, coerce, validator):
+    def _set_nodelay(self):
+        # frames are small and written once per tick, don't let them wait
+        # on acks (asyncio sets this too, uvloop and others may not)
+        sock = self.writer.get_extra_info('socket')
+        if sock is None or sock.family not in (socket.AF_INET, socket.AF_INET6):
+            return
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass
+
+    def detach_input(self):
         """
-        Implementation of read_until_valid in a single
-        coroutine that can be timed out by calling function
+        Stop reading the stream and return what was received but not
+        read yet, so another process can carry on with the connection.
+        Bytes the kernel hasn't passed on yet stay in the socket, only
+        half a utf-8 character at the end is lost.
         """
-        while True:
+        if self._reading is not None:
+            self._reading.cancel()
+        keys = ''.join(self._keys)
+        self._keys.clear()
+        self._lines = 0
+        return keys
+
+    def queue_input(self, keys):
+        """
+        Queue keys as if they had just been received
+        """
+        self._keys.extend(keys)
+        self._lines += keys.count('\n')
+        self._wake()
+
+    def _start_reading(self):
+        if self._reading is None:
+            self._reading = asyncio.create_task(self._read_input())
+
+    async def _read_input(self):
+        """
+        The only reader of the stream, queues decoded keys and wakes
+        up whoever is waiting for them
+        """
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        try:
+            while True:
+                data = await self.reader.read(1024)
+                if not data:
+                    return
+                text = decoder.decode(data)
+                self._keys.extend(text)
+                self._lines += text.count('\n')
+                if len(self._keys) > MAX_BUFFERED_INPUT:
+                    print(f"[!] {self.username} sent too much input")
+                    return
+                self._wake()
+        except OSError:
+            pass
+        finally:
+            self._eof = True
+            self._wake()
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _deadline(self, timeout):
+        if timeout is None:
+            return None
+        return asyncio.get_running_loop().time() + timeout
+
+    async def _wait_for_input(self, deadline, line=False):
+        """
+        wait until there is a key (or a whole line) queued, returns False
+        if the loop time reaches deadline first
+        """
+        self._start_reading()
+        loop = asyncio.get_running_loop()
+        while not (self._lines if line else self._keys):
+            if self._eof:
+                raise ConnectionResetError
+            if deadline is not None and loop.time() >= deadline:
+                return False
+            if self._waiter is not None:
+                raise RuntimeError("already waiting for input")
+            self._waiter = loop.create_future()
+            timer = None
+            if deadline is not None:
+                timer = loop.call_at(deadline, self._wake)
             try:
-                data = await self.readline()
-                data = coerce(data)
-                if validator(data):
-                    return data
-            except ValueError:
-                continue
+                await self._waiter
+            finally:
+                self._waiter = None
+                if timer is not None:
+                    timer.cancel()
+        return True
+
+    def _pop_line(self):
+        keys = self._keys
+        line = []
+        key = keys.popleft()
+        while key != '\n':
+            line.append(key)
+            key = keys.popleft()
+        self._lines -= 1
+        return ''.join(line).strip()
+
+    def abort(self):
+        """
+        Drop the connection and whatever output is still buffered
+        """
+        self._output.clear()
+        self._output_size = 0
+        self._count_closed()
+        self.writer.transport.abort()
 
     async def close(self):
         """
         Close the stream (send and EOF if possible).
         """
+        self.flush()
+        self._count_closed()
+        if self._reading is not None:
+            self._reading.cancel()
         try:
             self.writer.write_eof()
             await self.writer.drain()
@@ -192,3 +466,12 @@ class Player:
         self.writer.close()
         await self.writer.wait_closed()
         print("[-] connection closed")
+
+    def _count_closed(self):
+        if self._closed:
+            return
+        self._closed = True
+        metrics.connections_active.dec()
+        if self.flushes:
+            metrics.output_bytes_per_flush.observe(self.bytes_sent / self.flushes)
+            metrics.output_writes_per_flush.observe(self.writes / self.flushes)
@@ -0,0 +1,29 @@
+"""
+Connection preamble sent by the termninja client script.
+
+The first line a client sends may be a preamble answering the prompts
+up front, e.g.
+
+    TNJ1 token=... game=2 emoji=n realtime=1
+
+Any field can be left out, its prompt is then shown as usual. A client
+that doesn't send a preamble (ncat, older client scripts) is detected
+by its first line not starting with the version tag.
+"""
+
+PREAMBLE_VERSION = "TNJ1"
+
+
+def parse_preamble(line):
+    """
+    Returns a dict of the preamble fields, or None if line isn't one
+    """
+    parts = line.split()
+    if not parts or parts[0] != PREAMBLE_VERSION:
+        return None
+    fields = {}
+    for part in parts[1:]:
+        key, sep, value = part.partition("=")
+        if sep:
+            fields[key] = value
+    return fields
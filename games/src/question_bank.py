@@ -0,0 +1,146 @@
+"""
+Quiz questions stored in an indexed binary file, so a quiz can have
+millions of questions without any process loading them.
+
+    header   magic, version, question count and where the table starts
+    records  per question: prompt length, prompt, answer (utf-8)
+    table    count + 1 offsets, question i is records[table[i]:table[i + 1]]
+
+Everything is little endian. The file is mapped into memory, the pages
+are shared by every process on the host and only the ones holding the
+questions actually asked get read. A bank is written to a temporary
+file and renamed over the old one, a bank that's mapped is never
+changed under its readers.
+"""
+import mmap
+import os
+import random
+import struct
+import sys
+from array import array
+
+MAGIC = b"TNQB"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQQ")  # magic, version, unused, count, table offset
+RECORD = struct.Struct("<I")  # prompt length, prompt and answer follow
+OFFSET = struct.Struct("<Q")
+SPAN = struct.Struct("<QQ")  # two consecutive table entries
+
+
+def write_question_bank(path, questions):
+    """
+    Write (prompt, answer) pairs from any iterable as the bank at path,
+    returns how many were written
+    """
+    tmp_path = f"{path}.tmp"
+    offsets = array("Q", [HEADER.size])
+    with open(tmp_path, "wb") as f:
+        f.write(bytes(HEADER.size))
+        for prompt, answer in questions:
+            prompt = prompt.encode()
+            answer = answer.encode()
+            f.write(RECORD.pack(len(prompt)))
+            f.write(prompt)
+            f.write(answer)
+            offsets.append(offsets[-1] + RECORD.size + len(prompt) + len(answer))
+        count = len(offsets) - 1
+        table = offsets[-1]
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        f.write(offsets.tobytes())
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, 0, count, table))
+    os.replace(tmp_path, path)
+    return count
+
+
+class QuestionBank:
+    """
+    Read only view of a question bank file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, _, self.count, self._table = HEADER.unpack_from(self._data)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} isn't a version {VERSION} question bank")
+        if self._table + OFFSET.size * (self.count + 1) > len(self._data):
+            self.close()
+            raise ValueError(f"{path} is truncated")
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, idx):
+        """
+        (prompt, answer) of question idx
+        """
+        if not 0 <= idx < self.count:
+            raise IndexError(idx)
+        data = self._data
+        start, end = SPAN.unpack_from(data, self._table + idx * OFFSET.size)
+        (prompt_length,) = RECORD.unpack_from(data, start)
+        start += RECORD.size
+        prompt = data[start:start + prompt_length].decode()
+        answer = data[start + prompt_length:end].decode()
+        return prompt, answer
+
+    def read(self, indexes):
+        """
+        The questions at indexes, this is where pages not in memory yet
+        are read so it can be done from another thread
+        """
+        return [self[idx] for idx in indexes]
+
+    def sample(self, count):
+        """
+        count different random question indexes, or all of them if the
+        bank doesn't have that many
+        """
+        return random.sample(range(self.count), min(count, self.count))
+
+    def close(self):
+        self._data.close()
+
+
+# path -> QuestionBank, one mapping per process
+_question_banks = {}
+
+
+def _changed(old, new):
+    return (old.st_ino, old.st_size, old.st_mtime_ns) != (
+        new.st_ino, new.st_size, new.st_mtime_ns
+    )
+
+
+def get_question_bank(path):
+    """
+    The bank at path, mapped again when a new file was renamed over it.
+    The old mapping is left to the games still reading from it and goes
+    away with the last of them.
+    """
+    bank = _question_banks.get(path)
+    if bank is not None:
+        try:
+            if not _changed(bank.stat, os.stat(path)):
+                return bank
+        except OSError:
+            return bank
+    try:
+        new_bank = QuestionBank(path)
+    except (OSError, ValueError) as e:
+        if bank is None:
+            raise
+        print(f"[!] failed to reload {path}: {e!r}")
+        return bank
+    if bank is not None:
+        print(f"[+] loaded {len(new_bank)} questions from {path}")
+    _question_banks[path] = new_bank
+    return new_bank
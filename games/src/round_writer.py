@@ -0,0 +1,292 @@
+"""
+Write-behind storage of played rounds.
+
+Games hand their rounds to the writer and move on, rounds are written
+in batches (see termninja_db.rounds.add_rounds_played) whenever
+batch_size are queued or every flush_interval seconds. At most
+max_pending rounds are held in memory, past that, and for anything
+still queued at shutdown, rounds are appended to a journal file which
+is replayed when the server starts again.
+
+A batch the database rejects is split up until the rounds it won't
+take are found, those are moved to a dead letter file next to the
+journal (journal_path + ".rejected") and the rest are written. The
+files are only touched from the executor, the event loop never waits
+on a lock held by another process.
+"""
+import asyncio
+import datetime
+import fcntl
+import json
+import os
+import time
+from asyncpg.exceptions import DataError, IntegrityConstraintViolationError
+import termninja_db as db
+from . import metrics
+from .tokens import play_tokens
+
+# errors down to the rounds in a batch rather than the database, trying
+# the same rounds again won't help
+REJECTED = (DataError, IntegrityConstraintViolationError, TypeError, ValueError)
+
+
+def _dump(round_played):
+    return json.dumps(
+        {**round_played, "played_at": round_played["played_at"].isoformat()}
+    ) + "\n"
+
+
+def _load(line):
+    round_played = json.loads(line)
+    round_played["played_at"] = datetime.datetime.fromisoformat(
+        round_played["played_at"]
+    )
+    return round_played
+
+
+def _append(path, data):
+    """
+    Append to the file at path holding its lock, blocks so it's run in
+    the executor
+    """
+    while True:
+        with open(path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                moved = os.stat(path).st_ino != os.fstat(f.fileno()).st_ino
+            except FileNotFoundError:
+                moved = True
+            if not moved:
+                f.write(data)
+                return
+            # taken for replaying while we waited for the lock
+
+
+def _take(path, replaying_path):
+    """
+    Move the journal at path to replaying_path (added to the end of it
+    if a replay was cut short), returns the rounds to replay
+    """
+    try:
+        f = open(path, "r")
+    except FileNotFoundError:
+        pass
+    else:
+        with f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            if os.path.exists(replaying_path):
+                with open(replaying_path, "a") as replaying:
+                    replaying.write(f.read())
+                os.unlink(path)
+            else:
+                os.rename(path, replaying_path)
+    rounds = []
+    try:
+        with open(replaying_path, "r") as f:
+            for line in f:
+                try:
+                    rounds.append(_load(line))
+                except ValueError:
+                    continue  # cut off by a crash
+    except FileNotFoundError:
+        pass
+    return rounds
+
+
+class RoundWriter:
+    def __init__(self, batch_size=100, flush_interval=1, max_pending=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.journal_path = None
+        self.lost = 0  # not stored and not journaled either
+        self.rejected = 0  # moved to the dead letter file
+        self._pending = []
+        self._overflow = []  # past max_pending, on their way to the journal
+        self._spilling = None
+        self._lock = None
+        self._wakeup = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    @property
+    def rejected_path(self):
+        return f"{self.journal_path}.rejected"
+
+    async def start(self, journal_path):
+        self.journal_path = journal_path
+        os.makedirs(os.path.dirname(journal_path) or ".", exist_ok=True)
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        await self.replay_journal()
+        self._task = asyncio.create_task(self._flush_forever())
+
+    async def close(self):
+        """
+        Write what's queued, journal whatever can't be written
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._spilling is not None:
+            await self._spilling
+        if self._pending:
+            rounds, self._pending = self._pending, []
+            if await self._spill(rounds):
+                print(f"[-] journaled {len(rounds)} rounds to {self.journal_path}")
+
+    def add(self, slug, username, score, message="", snapshot=None):
+        round_played = {
+            "game_slug": slug,
+            "user_username": username,
+            "score": score,
+            "played_at": datetime.datetime.now(),
+            "message": message,
+            "snapshot": snapshot,
+        }
+        if len(self._pending) >= self.max_pending:
+            # the database is slow or down
+            self._overflow.append(round_played)
+            if self._spilling is None:
+                self._spilling = asyncio.create_task(self._spill_overflow())
+            return
+        self._pending.append(round_played)
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self):
+        """
+        Write everything queued, stops when the database can't be
+        reached and keeps the rest queued to retry
+        """
+        async with self._lock:
+            while self._pending:
+                batch = self._pending[: self.batch_size]
+                done = await self._write(batch)
+                del self._pending[:done]
+                if done < len(batch):
+                    return
+
+    async def _flush_forever(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def _write(self, batch):
+        """
+        Store batch, returns how many rounds from the start of it are
+        done with (written or rejected). A rejected batch is split in
+        halves until the rounds the database won't take are found.
+        """
+        start = time.perf_counter()
+        try:
+            await db.rounds.add_rounds_played(batch)
+        except REJECTED as e:
+            if len(batch) == 1:
+                await self._reject(batch[0], e)
+                return 1
+            half = len(batch) // 2
+            done = await self._write(batch[:half])
+            if done < half:
+                return done
+            return half + await self._write(batch[half:])
+        except Exception as e:
+            print(f"[!] failed to store {len(batch)} rounds: {e!r}")
+            return 0
+        metrics.round_write_seconds.observe(time.perf_counter() - start)
+        metrics.rounds_written.inc(len(batch))
+        for round_played in batch:
+            # the cached record has the old total_score
+            play_tokens.invalidate_user(round_played["user_username"])
+        return len(batch)
+
+    async def _reject(self, round_played, error):
+        print(f"[!] round rejected, moved to {self.rejected_path}: {error!r}")
+        line = _dump({**round_played, "error": repr(error)})
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, _append, self.rejected_path, line)
+        except OSError as e:
+            self.lost += 1
+            metrics.rounds_lost.inc()
+            print(f"[!] failed to write rejected round: {e!r}")
+            return
+        self.rejected += 1
+        metrics.rounds_rejected.inc()
+
+    async def _spill(self, rounds):
+        lines = "".join(_dump(r) for r in rounds)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, _append, self.journal_path, lines)
+        except OSError as e:
+            self.lost += len(rounds)
+            metrics.rounds_lost.inc(len(rounds))
+            print(f"[!] failed to journal {len(rounds)} rounds: {e!r}")
+            return False
+        metrics.rounds_journaled.inc(len(rounds))
+        return True
+
+    async def _spill_overflow(self):
+        try:
+            while self._overflow:
+                rounds, self._overflow = self._overflow, []
+                await self._spill(rounds)
+        finally:
+            self._spilling = None
+
+    async def replay_journal(self):
+        """
+        Write the rounds journaled by a previous run. The journal is
+        moved aside first (under its lock, so a process being replaced
+        can't be appending to it) and whatever can't be written now is
+        journaled again.
+        """
+        replaying_path = f"{self.journal_path}.replaying"
+        loop = asyncio.get_running_loop()
+        rounds = await loop.run_in_executor(
+            None, _take, self.journal_path, replaying_path
+        )
+        if not rounds:
+            if os.path.exists(replaying_path):
+                os.unlink(replaying_path)
+            return
+
+        written = 0
+        while written < len(rounds):
+            batch = rounds[written:written + self.batch_size]
+            done = await self._write(batch)
+            written += done
+            if done < len(batch):
+                break
+
+        if written < len(rounds) and not await self._spill(rounds[written:]):
+            return  # still in the replaying file for next time
+        os.unlink(replaying_path)
+        print(
+            f"[+] replayed {written} rounds from {self.journal_path}, "
+            f"{len(rounds) - written} left"
+        )
+
+
+round_writer = RoundWriter(
+    batch_size=int(os.environ.get("ROUND_BATCH_SIZE", 100)),
+    flush_interval=float(os.environ.get("ROUND_FLUSH_INTERVAL", 1)),
+    max_pending=int(os.environ.get("ROUND_QUEUE_SIZE", 10000)),
+)
+metrics.Gauge(
+    "termninja_round_queue_size",
+    "Rounds waiting to be written",
+    fn=lambda: len(round_writer),
+)
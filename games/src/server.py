@@ -5,11 +5,18 @@ import functools
 import signal
 import os
 import ssl
+import time
 import termninja_db as db
-from . import cursor
+from . import cursor, handoff, metrics
 from .player import Player
+from .loops import install_loop_policy
 from .reloader import watchdog
-from .messages import TERMNINJA_PROMPT
+from .supervisor import WorkerSupervisor
+from .throttle import RedisSyncedLimiter
+from .tokens import play_tokens
+from .game import StoreGamesMixin, running_games
+from .round_writer import round_writer
+from .messages import TERMNINJA_PROMPT, SERVER_RESTARTING
 
 
 class RegisterGamesMixin:
@@ -35,39 +42,42 @@ class RegisterGamesMixin:
 
 class ThrottleConnectionsMixin:
     """
-    Throttle connections to a set number per minute using
-    redis.
+    Throttle connections to a set number per minute per address.
+    Admission is decided in process, counts are shared between nodes
+    through redis in the background.
     """
 
     REDIS_HOST = os.environ.get("REDIS_HOST", "redis")
     THROTTLED_MESSAGE = cursor.red("\n\n\t\tTHROTTLED\n\n")
     MAX_CONNECTIONS_PER_MINUTE = int(os.environ.get("MAX_CONNECTIONS_PER_MINUTE", 5))
+    THROTTLE_SYNC_INTERVAL = float(os.environ.get("THROTTLE_SYNC_INTERVAL", 1))
+    THROTTLE_MAX_ADDRESSES = int(os.environ.get("THROTTLE_MAX_ADDRESSES", 100000))
 
     async def initialize(self):
         self.redis = await aioredis.create_redis_pool(
             f"redis://{self.REDIS_HOST}", maxsize=2
         )
+        self.limiter = RedisSyncedLimiter(
+            self.redis,
+            self.MAX_CONNECTIONS_PER_MINUTE,
+            sync_interval=self.THROTTLE_SYNC_INTERVAL,
+            max_addresses=self.THROTTLE_MAX_ADDRESSES,
+        )
+        self.limiter.start()
         return await super().initialize()
 
-    def make_key_for(self, player):
-        now = datetime.datetime.now()
-        return f"{player.address}:{now.minute}"
-
     async def should_accept_player(self, player):
-        key = self.make_key_for(player)
-        res = await self.redis.get(key)
-        if res and int(res) > self.MAX_CONNECTIONS_PER_MINUTE:
+        if not self.limiter.allow(player.address):
+            metrics.throttled_connections.inc()
             await player.send(self.THROTTLED_MESSAGE)
             return False
-        trans = self.redis.multi_exec()
-        trans.incr(key)
-        trans.expire(key, 60)
-        await trans.execute()
         return await super().should_accept_player(player)
 
     async def teardown(self):
+        await self.limiter.stop()
         self.redis.close()
         await self.redis.wait_closed()
+        return await super().teardown()
 
 
 class SSLMixin:
@@ -103,6 +113,7 @@ class OptionalAuthenticationMixin:
     otherwise play anonymously
     """
 
+    REDIS_HOST = os.environ.get("REDIS_HOST", "redis")
     enter_token_prompt = f"Enter a play token or press enter " "to play anonymously: "
     erase_input = (
         f"{cursor.up(1)}"
@@ -117,22 +128,32 @@ class OptionalAuthenticationMixin:
     def token_is_expired(expiration_datetime):
         return expiration_datetime < datetime.datetime.now()
 
+    async def initialize(self):
+        self._token_listener = asyncio.create_task(
+            play_tokens.listen_for_rotations(self.REDIS_HOST)
+        )
+        return await super().initialize()
+
+    async def teardown(self):
+        self._token_listener.cancel()
+        return await super().teardown()
+
     async def should_accept_player(self, player):
-        try:
-            # allow the token to be piped to stdin on ncat call
-            # e.g. with termninja client script -t
-            token = await player.readline(timeout=0.1)
-            await player.send(f"{self.enter_token_prompt}\n")
-        except asyncio.TimeoutError:
-            # user must enter the token interactively
-            await player.send(self.enter_token_prompt)
-            token = await player.readline()
+        await player.send(self.enter_token_prompt)
+        token = await player.readline()
+        if player.apply_preamble(token):
+            # the preamble isn't echoed, end the prompt line ourselves
+            await player.send("\n")
+            token = player.preamble.get("token")
+            if token is None:
+                await player.send(self.enter_token_prompt)
+                token = await player.readline()
 
         # play anonymously
         if token == "":
             return await self.on_token_anonymous(player)
 
-        db_user = await db.users.select_by_play_token(token)
+        db_user = await play_tokens.lookup(token)
 
         # token rejected
         if db_user is None:
@@ -167,25 +188,267 @@ class OptionalAuthenticationMixin:
             f"username:         {cursor.green(player.username)}\n"
             f"score:            {cursor.green(player.total_score)}\n"
             f"token expires in: {cursor.green(player.play_token_expires_at)}\n"
-            f"\n{cursor.yellow('Press enter to continue...')}"
         )
-        await player.readline()
+        if not player.has_preamble:
+            # scripted clients skip straight ahead
+            await player.send(f"\n{cursor.yellow('Press enter to continue...')}")
+            await player.readline()
         return await super().on_player_accepted(player)
 
 
+class MetricsMixin:
+    """
+    Serve metrics in the Prometheus text format at /metrics. Workers
+    listen on TERMNINJA_METRICS_PORT + worker_id, unset to disable.
+
+    Only one process serves a port at a time: the port is bound once the
+    game listener is ours (taken over or not), and a process handing off
+    closes it before giving the game listener away.
+    """
+
+    METRICS_PORT = os.environ.get("TERMNINJA_METRICS_PORT")
+
+    async def initialize(self):
+        self._metrics_server = None
+        return await super().initialize()
+
+    async def start_async_server(self, **kwargs):
+        server = await super().start_async_server(**kwargs)
+        await self._start_metrics()
+        return server
+
+    async def teardown(self):
+        await self._stop_metrics()
+        return await super().teardown()
+
+    async def on_handing_off(self):
+        await self._stop_metrics()
+        return await super().on_handing_off()
+
+    async def on_handoff_failed(self):
+        await self._start_metrics()
+        return await super().on_handoff_failed()
+
+    async def _start_metrics(self):
+        if not self.METRICS_PORT or self._metrics_server is not None:
+            return
+        port = int(self.METRICS_PORT) + self.worker_id
+        try:
+            self._metrics_server = await metrics.serve_metrics("0.0.0.0", port)
+        except OSError as e:
+            print(f"[!] not serving metrics on port {port}: {e!r}")
+
+    async def _stop_metrics(self):
+        if self._metrics_server is not None:
+            self._metrics_server.close()
+            await self._metrics_server.wait_closed()
+            self._metrics_server = None
+
+
+class HotRestartMixin:
+    """
+    Take over the listening socket and idle connections of a server
+    that is already running on startup, and hand ours over to the next
+    process the same way. Only enabled when TERMNINJA_HANDOFF_SOCKET is
+    set, see handoff.py for the protocol.
+
+    Connections at the token prompt or the menu are handed over, the
+    new process asks them again. TLS connections can't be handed over
+    (their session state lives in this process) and are drained instead.
+    """
+
+    HANDOFF_SOCKET = os.environ.get("TERMNINJA_HANDOFF_SOCKET")
+    HANDOFF_STAGES = ("accepting", "menu")
+
+    @property
+    def handoff_path(self):
+        if self.HANDOFF_SOCKET:
+            return f"{self.HANDOFF_SOCKET}.{self.worker_id}"
+        return None
+
+    async def initialize(self):
+        self._inherited_listener = None
+        self._handoff_conn = None
+        self._handoff_listener = None
+        self._handing_off = set()
+        if self.handoff_path:
+            conn = handoff.connect(self.handoff_path)
+            if conn is not None:
+                loop = asyncio.get_running_loop()
+                self._inherited_listener = await loop.run_in_executor(
+                    None, handoff.take_over_listener, conn
+                )
+                self._handoff_conn = conn
+                print("[+] took over listening socket")
+        return await super().initialize()
+
+    async def start_async_server(self, **kwargs):
+        if self._inherited_listener is not None:
+            kwargs.pop("host", None)
+            kwargs.pop("port", None)
+            kwargs["sock"] = self._inherited_listener
+        server = await super().start_async_server(**kwargs)
+        if self._handoff_conn is not None:
+            await self._take_over_connections()
+        if self.handoff_path:
+            self._listen_for_handoff(server)
+        return server
+
+    async def teardown(self):
+        self._stop_listening_for_handoff()
+        return await super().teardown()
+
+    async def on_connection_cancelled(self, player):
+        if player in self._handing_off:
+            return  # the socket is passed on, don't close it
+        return await super().on_connection_cancelled(player)
+
+    async def _take_over_connections(self):
+        loop = asyncio.get_running_loop()
+        conn, self._handoff_conn = self._handoff_conn, None
+        try:
+            connections = await loop.run_in_executor(
+                None, handoff.take_over_connections, conn
+            )
+        finally:
+            conn.close()
+        for sock, info in connections:
+            asyncio.create_task(self._resume_connection(sock, info))
+        print(f"[+] took over {len(connections)} idle connections")
+
+    async def _resume_connection(self, sock, info):
+        reader, writer = await asyncio.open_connection(sock=sock)
+        player = Player(reader, writer)
+        player.queue_input(info.get("input", ""))
+        if info["stage"] != "menu":
+            return await self._serve_player(player)
+        if info["username"] is not None:
+            db_user = await db.users.select_by_username(
+                info["username"], authenticated=True
+            )
+            if db_user is not None:
+                player.assign_db_user(db_user)
+        await self._serve_player(player, accepted=True)
+
+    def _listen_for_handoff(self, server):
+        self._handoff_listener = handoff.listen(self.handoff_path)
+        asyncio.get_running_loop().add_reader(
+            self._handoff_listener, self._on_handoff_request, server
+        )
+
+    def _stop_listening_for_handoff(self):
+        if self._handoff_listener is not None:
+            asyncio.get_running_loop().remove_reader(self._handoff_listener)
+            # the socket file now belongs to the process we handed off to
+            self._handoff_listener.close()
+            self._handoff_listener = None
+
+    def _on_handoff_request(self, server):
+        conn, _ = self._handoff_listener.accept()
+        conn.settimeout(handoff.TIMEOUT)
+        self._stop_listening_for_handoff()
+        asyncio.create_task(self._hand_off(conn, server))
+
+    async def _hand_off(self, conn, server):
+        loop = asyncio.get_running_loop()
+        await self.on_handing_off()
+        try:
+            await loop.run_in_executor(
+                None, handoff.give_listener, conn, server.sockets[0]
+            )
+        except (OSError, ConnectionError) as e:
+            print(f"[!] handoff failed, still serving: {e!r}")
+            conn.close()
+            self._listen_for_handoff(server)
+            await self.on_handoff_failed()
+            return
+
+        # the new process is accepting on the same socket now
+        server.close()
+        idle = [
+            player
+            for player, stage in self._stages.items()
+            if stage in self.HANDOFF_STAGES
+            and player.writer.get_extra_info("sslcontext") is None
+        ]
+        connections = [
+            (player.writer.get_extra_info("socket"), self._handoff_info(player))
+            for player in idle
+        ]
+        tasks = [self._connections[player] for player in idle]
+        for player, task in zip(idle, tasks):
+            player.writer.transport.pause_reading()
+            self._handing_off.add(player)
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for player, (_, info) in zip(idle, connections):
+            # typed ahead, the new process reads it first
+            info["input"] = player.detach_input()
+        try:
+            await loop.run_in_executor(
+                None, handoff.give_connections, conn, connections
+            )
+            print(f"[-] handed off listener and {len(idle)} idle connections")
+        except (OSError, ConnectionError) as e:
+            print(f"[!] handing off idle connections failed: {e!r}")
+        finally:
+            conn.close()
+            for player in idle:
+                # close our copy of the socket without shutting it down
+                player.abort()
+        self.handed_off = True
+        self._stop_requested.set()
+
+    def _handoff_info(self, player):
+        return {
+            "stage": self._stages[player],
+            "username": player.identity["username"],
+        }
+
+
 class BaseServer:
+    # seconds running games get to finish once a stop signal is received
+    drain_timeout = float(os.environ.get("TERMNINJA_DRAIN_TIMEOUT", 30))
+    # rounds that can't be written are journaled here, one file per worker
+    round_journal = os.environ.get("TERMNINJA_ROUND_JOURNAL", "journal/rounds")
+
     def __init__(self):
         self.games = []
+        self.worker_id = 0
         self._prompt = None
+        self._server = None
+        self._stop_requested = None
+        self._connections = {}  # player -> task, until they are in a game
+        self._stages = {}  # player -> "accepting", "menu" or "game"
+        self.handed_off = False  # another process took over, see HotRestartMixin
 
     def add_game(self, game_class):
         self.games.append(game_class)
 
-    def start(self, debug=True, **kwargs):
+    def start(self, debug=True, workers=1, loop_policy="asyncio", **kwargs):
+        """
+        Run the server. With workers > 1 a supervisor forks that many
+        processes which all accept on the same port (SO_REUSEPORT).
+
+        loop_policy is "asyncio" (default) or "uvloop". The watchdog
+        restarts this script with the same arguments, so the policy is
+        applied in the reloaded process as well.
+        """
         if debug and os.environ.get("TERMNINJA_SERVER_RUNNING") != "true":
             watchdog(2)
+        elif workers > 1:
+            target = functools.partial(
+                self._run_worker, debug=debug, loop_policy=loop_policy, **kwargs
+            )
+            WorkerSupervisor(target, workers).run()
         else:
-            asyncio.run(self._start_serving(**kwargs), debug=debug)
+            self._run_worker(0, debug=debug, loop_policy=loop_policy, **kwargs)
+
+    def _run_worker(self, worker_id, debug=False, loop_policy="asyncio", **kwargs):
+        self.worker_id = worker_id
+        install_loop_policy(loop_policy)
+        asyncio.run(self._start_serving(**kwargs), debug=debug)
+        return self.handed_off
 
     async def on_player_connected(self, player):
         """
@@ -211,25 +474,34 @@ class BaseServer:
         """
         pass
 
+    async def on_handing_off(self):
+        """
+        called before the listener is handed to a new process (see
+        HotRestartMixin), anything only one process may hold is let go here
+        """
+        pass
+
+    async def on_handoff_failed(self):
+        """
+        called when handing off failed and this process keeps serving
+        """
+        pass
+
     async def start_async_server(self, **kwargs):
         return await asyncio.start_server(
             self._on_connection, reuse_port=True, **kwargs
         )
 
     async def get_game_choice(self, player):
-        try:
-            # for scripted environments to pipe from stdin
-            # e.g. termninja client
-            raw_choice = await player.readline(timeout=0.1)
-            choice = self._validate_choice(raw_choice)
-            if choice is not None:
-                await player.clear_input_buffer()
-                return choice
-        except asyncio.TimeoutError:
-            pass
+        choice = self._validate_choice(player.preamble.get("game", ""))
+        if choice is not None:
+            return choice
         while True:
             await player.send(self._prompt)
             raw_choice = await player.readline()
+            if player.apply_preamble(raw_choice):
+                # no token prompt was sent, this is the first line
+                raw_choice = player.preamble.get("game", "")
             choice = self._validate_choice(raw_choice)
             if choice is not None:
                 return choice
@@ -247,11 +519,14 @@ class BaseServer:
         return TERMNINJA_PROMPT.format(game_choices)
 
     async def initialize(self):
+        self._stop_requested = asyncio.Event()
         self._register_signal_handlers()
         self._prompt = self.make_game_prompt()
         await db.conn.connect()
+        await round_writer.start(f"{self.round_journal}.{self.worker_id}")
 
     async def teardown(self):
+        await round_writer.close()
         await db.conn.disconnect()
 
     def _register_signal_handlers(self):
@@ -265,9 +540,67 @@ class BaseServer:
             )
 
     def _handle_stop_signal(self):
+        """
+        Drain on the first signal, give up and cancel everything
+        on the second one
+        """
+        if not self._stop_requested.is_set():
+            self._stop_requested.set()
+            return
         for task in asyncio.Task.all_tasks():
             task.cancel()
 
+    async def drain(self):
+        """
+        Stop accepting connections, send away players that are not in
+        a game yet and give running games drain_timeout seconds to
+        finish before cancelling them. Games store their rounds when
+        they finish or are cancelled, rounds that can't be written to
+        the database are journaled.
+        """
+        print(f"[-] draining, {len(running_games)} games running")
+        lost_before = StoreGamesMixin.rounds_lost + round_writer.lost
+        self._server.close()
+
+        connections = list(self._connections.values())
+        for task in connections:
+            task.cancel()
+
+        await self._notify_running_games()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.drain_timeout
+        while running_games:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                print(f"[-] cancelling {len(running_games)} games")
+                tasks = list(running_games)
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                break
+            await asyncio.wait(list(running_games), timeout=remaining)
+
+        await asyncio.gather(*connections, return_exceptions=True)
+        await round_writer.flush()
+        lost = (
+            StoreGamesMixin.rounds_lost
+            + round_writer.lost
+            - lost_before
+            + StoreGamesMixin.rounds_pending
+        )
+        print(f"[-] drained, {lost} rounds lost, {len(round_writer)} to journal")
+
+    async def _notify_running_games(self, timeout=1):
+        notices = [
+            asyncio.create_task(game.on_server_draining())
+            for game in running_games.values()
+        ]
+        if notices:
+            # don't wait on players that aren't reading
+            _, pending = await asyncio.wait(notices, timeout=timeout)
+            for task in pending:
+                task.cancel()
+
     def _validate_choice(self, raw_choice):
         try:
             choice = int(raw_choice.strip())
@@ -279,27 +612,55 @@ class BaseServer:
 
     async def _start_serving(self, **kwargs):
         await self.initialize()
-        await self.on_server_ready()
-        server = await self.start_async_server(**kwargs)
-        async with server:
-            try:
-                print("Server starting...")
-                await server.serve_forever()
-            except asyncio.CancelledError:
-                await self.teardown()
+        try:
+            await self.on_server_ready()
+            self._server = await self.start_async_server(**kwargs)
+            print("Server starting...")
+            await self._stop_requested.wait()
+            await self.drain()
+        finally:
+            await self.teardown()
 
     async def _on_connection(self, reader, writer):
+        await self._serve_player(Player(reader, writer))
+
+    async def _serve_player(self, player, accepted=False):
         """
         figure out what game they want to play and send them to the
         appropriate manager for that game
         """
-        player = Player(reader, writer)
+        self._connections[player] = asyncio.current_task()
+        start = time.perf_counter()
         try:
-            await self._accept_player(player)
+            if not accepted:
+                self._stages[player] = "accepting"
+                await self._accept_player(player)
+            self._stages[player] = "menu"
             choice = await self.get_game_choice(player)
+            self._stages[player] = "game"
+            metrics.handshake_seconds.observe(time.perf_counter() - start)
             await self.games[choice].player_connected(player)
         except (ConnectionResetError, ConnectionRefusedError):
             await player.close()
+        except asyncio.CancelledError:
+            await self.on_connection_cancelled(player)
+        finally:
+            del self._connections[player]
+            del self._stages[player]
+
+    async def on_connection_cancelled(self, player):
+        """
+        hook called when a player's connection is cancelled before
+        they reach a game, i.e. the server is draining
+        """
+        await self._send_away(player)
+
+    async def _send_away(self, player):
+        try:
+            await asyncio.wait_for(player.send(SERVER_RESTARTING), 1)
+        except (ConnectionResetError, BrokenPipeError, asyncio.TimeoutError):
+            pass
+        await player.close()
 
     async def _accept_player(self, player):
         """
@@ -312,10 +673,12 @@ class BaseServer:
 
 
 class Server(
+    MetricsMixin,
     RegisterGamesMixin,
     ThrottleConnectionsMixin,
     OptionalAuthenticationMixin,
     SSLMixin,
+    HotRestartMixin,
     BaseServer,
 ):
     pass
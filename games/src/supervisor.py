@@ -0,0 +1,80 @@
+"""
+Pre-fork supervisor for running the games server on every core.
+
+The listening socket is bound with SO_REUSEPORT in each worker so the
+kernel spreads incoming connections across them. Every worker is a
+forked process with its own event loop, database pool and redis pool.
+"""
+import multiprocessing
+import signal
+import sys
+import time
+from multiprocessing.connection import wait
+
+# exit code of a worker whose connections were handed over to a new
+# process (see HotRestartMixin), it's done and isn't replaced
+HANDED_OFF = 3
+
+
+class WorkerSupervisor:
+    """
+    Fork `workers` processes running target(worker_id), restart any that
+    die unexpectedly and pass stop signals on to all of them. A target
+    returns True when another process took its work over, that worker
+    isn't restarted and the supervisor exits after the last of them.
+    """
+
+    restart_delay = 1  # seconds to wait before replacing a crashed worker
+
+    def __init__(self, target, workers):
+        self.target = target
+        self.workers = workers
+        self._processes = {}
+        self._stopping = False
+
+    def run(self):
+        for signame in ("SIGINT", "SIGTERM"):
+            signal.signal(getattr(signal, signame), self._handle_stop_signal)
+
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+
+        while self._processes:
+            sentinels = {p.sentinel: wid for wid, p in self._processes.items()}
+            for sentinel in wait(list(sentinels)):
+                self._on_worker_exit(sentinels[sentinel])
+
+    def _spawn(self, worker_id):
+        process = multiprocessing.Process(
+            target=self._run_worker, args=(worker_id,), daemon=False
+        )
+        process.start()
+        self._processes[worker_id] = process
+        print(f"[+] worker {worker_id} started (pid {process.pid})")
+
+    def _run_worker(self, worker_id):
+        # the worker installs its own handlers on the event loop, until
+        # then it should not run the supervisor's handler
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        if self.target(worker_id):
+            sys.exit(HANDED_OFF)
+
+    def _on_worker_exit(self, worker_id):
+        process = self._processes.pop(worker_id)
+        process.join()
+        if process.exitcode == HANDED_OFF:
+            print(f"[-] worker {worker_id} handed off to a new process")
+            return
+        print(f"[-] worker {worker_id} exited with code {process.exitcode}")
+        if not self._stopping:
+            time.sleep(self.restart_delay)
+            self._spawn(worker_id)
+
+    def _handle_stop_signal(self, signum, frame):
+        if self._stopping:
+            return
+        self._stopping = True
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
@@ -0,0 +1,217 @@
+"""
+In-process connection throttling.
+
+Admission is decided locally with a token bucket per peer address so the
+accept path never waits on redis. Accepted connections are counted and
+pushed to redis in batches, and on every sync the cluster wide counts of
+the addresses that connected in the last few syncs are read back and
+what other nodes accepted is taken out of the local buckets. An address
+new to a node, or back after a while, is read from redis right away
+instead of at the next sync. The limit therefore holds across nodes,
+give or take what the other nodes accept within one sync interval.
+"""
+import aioredis
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "pending", "window", "seen")
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+        self.pending = 0  # accepted here but not pushed to redis yet
+        self.window = None  # redis window that seen belongs to
+        self.seen = 0  # cluster total for that window at last sync
+
+
+class TokenBucketLimiter:
+    """
+    Allow `rate` connections per `period` seconds for each address.
+    At most `max_addresses` buckets are kept, the least recently used
+    ones are dropped first (an idle bucket is a full bucket anyway).
+    """
+
+    def __init__(self, rate, period=60, max_addresses=100000, clock=time.monotonic):
+        self.capacity = rate
+        self.refill_rate = rate / period
+        self.period = period
+        self.max_addresses = max_addresses
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._pending = {}  # address -> bucket, with connections to push
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def allow(self, address):
+        """
+        Take a token for address, returns False if there are none left
+        """
+        bucket = self._get_bucket(address)
+        if bucket.tokens < 1:
+            return False
+        bucket.tokens -= 1
+        bucket.pending += 1
+        self._pending[address] = bucket
+        return True
+
+    def _get_bucket(self, address):
+        now = self.clock()
+        bucket = self._buckets.get(address)
+        if bucket is None:
+            bucket = _Bucket(self.capacity, now)
+            self._buckets[address] = bucket
+            if len(self._buckets) > self.max_addresses:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(address)
+            elapsed = now - bucket.updated
+            bucket.tokens = min(
+                self.capacity, bucket.tokens + elapsed * self.refill_rate
+            )
+            bucket.updated = now
+        return bucket
+
+    def take_pending(self):
+        """
+        Return (address, bucket, count) for every address with accepted
+        connections not pushed to redis yet, and reset their counts
+        """
+        batch = []
+        for address, bucket in self._pending.items():
+            batch.append((address, bucket, bucket.pending))
+            bucket.pending = 0
+        self._pending.clear()
+        return batch
+
+    def apply_remote(self, bucket, window, total, pushed):
+        """
+        total is the cluster wide count for the window after pushing
+        `pushed` of our own, whatever else was added came from other nodes
+        """
+        if bucket.window != window:
+            bucket.window = window
+            bucket.seen = 0
+        remote = total - bucket.seen - pushed
+        bucket.seen = total
+        if remote > 0:
+            bucket.tokens = max(-self.capacity, bucket.tokens - remote)
+
+
+class RedisSyncedLimiter(TokenBucketLimiter):
+    """
+    TokenBucketLimiter that shares its counts with other nodes
+    through redis every `sync_interval` seconds. Counts are read for
+    the addresses that connected in the last `recent_syncs` syncs, so
+    what each sync reads grows with traffic rather than with history.
+    """
+
+    key_prefix = "throttle"
+
+    def __init__(self, redis, rate, sync_interval=1, recent_syncs=5, **kwargs):
+        super().__init__(rate, **kwargs)
+        self.redis = redis
+        self.sync_interval = sync_interval
+        self.recent_syncs = recent_syncs
+        self._syncs = 0
+        self._recent = OrderedDict()  # address -> sync it last connected in
+        self._new_addresses = []  # not recent before, read at once
+        self._wakeup = None
+        self._task = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._sync_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        try:
+            await self.sync()
+        except (aioredis.RedisError, OSError) as e:
+            # don't keep the rest of the server from shutting down
+            print(f"[!] throttle sync failed: {e}")
+
+    def allow(self, address):
+        if address not in self._recent:
+            # other nodes may have used its tokens up already
+            self._new_addresses.append(address)
+            if self._wakeup is not None:
+                self._wakeup.set()
+        self._recent[address] = self._syncs
+        self._recent.move_to_end(address)
+        return super().allow(address)
+
+    def _recent_addresses(self):
+        """
+        Forget addresses that haven't connected in recent_syncs syncs,
+        returns the rest
+        """
+        self._syncs += 1
+        oldest = self._syncs - self.recent_syncs
+        recent = self._recent
+        while recent and next(iter(recent.values())) < oldest:
+            recent.popitem(last=False)
+        return list(recent)
+
+    def _key(self, address, window):
+        return f"{self.key_prefix}:{address}:{window}"
+
+    async def sync(self, addresses=None):
+        """
+        Push the connections accepted here and read the cluster wide
+        counts for addresses, the recent ones by default
+        """
+        batch = self.take_pending()
+        pushed = {address for address, _, _ in batch}
+        if addresses is None:
+            addresses = self._recent_addresses()
+        reads = [
+            (address, self._buckets[address])
+            for address in addresses
+            if address in self._buckets and address not in pushed
+        ]
+        if not batch and not reads:
+            return
+        window = int(time.time() // self.period)
+        trans = self.redis.multi_exec()
+        for address, _, count in batch:
+            key = self._key(address, window)
+            trans.incrby(key, count)
+            trans.expire(key, self.period * 2)
+        if reads:
+            trans.mget(*[self._key(address, window) for address, _ in reads])
+        results = await trans.execute()
+        for (_, bucket, count), total in zip(batch, results[:2 * len(batch):2]):
+            self.apply_remote(bucket, window, total, count)
+        if reads:
+            for (_, bucket), total in zip(reads, results[-1]):
+                self.apply_remote(bucket, window, int(total or 0), 0)
+
+    async def _sync_forever(self):
+        loop = asyncio.get_running_loop()
+        next_sync = loop.time() + self.sync_interval
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), max(0, next_sync - loop.time())
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            addresses, self._new_addresses = self._new_addresses, []
+            if loop.time() >= next_sync:
+                next_sync = loop.time() + self.sync_interval
+                addresses = None
+            try:
+                await self.sync(addresses)
+            except (aioredis.RedisError, OSError) as e:
+                # counts for this batch are lost, keep limiting locally
+                print(f"[!] throttle sync failed: {e}")
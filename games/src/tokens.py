@@ -0,0 +1,137 @@
+"""
+Cache of play token -> user record for authenticating connections.
+
+Entries live for at most `ttl` seconds and never past the token's
+play_token_expires_at. When refresh_play_token rotates a token it
+publishes the username on termninja_db.users.PLAY_TOKEN_ROTATED_CHANNEL
+and every games process drops its entry for that user. Rotations
+published while a process isn't subscribed are missed, so the whole
+cache is dropped when it subscribes again.
+"""
+import aioredis
+import asyncio
+import datetime
+import os
+import time
+from collections import OrderedDict
+import termninja_db as db
+from . import metrics
+
+
+class PlayTokenCache:
+    def __init__(self, ttl=30, max_entries=10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()  # token -> (deadline, user)
+        self._tokens_by_username = {}
+        # a lookup doesn't cache what it read if the user was invalidated
+        # while it waited for the database, see _invalidated_since
+        self._generation = 0
+        self._invalidated = OrderedDict()  # username -> generation
+        self._forgotten = 0  # newest generation dropped from _invalidated
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, token):
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        deadline, user = entry
+        if deadline <= self.clock():
+            self._discard(token)
+            return None
+        self._entries.move_to_end(token)
+        return user
+
+    def put(self, token, user):
+        now = self.clock()
+        ttl = self.ttl
+        remaining = (
+            user["play_token_expires_at"] - datetime.datetime.now()
+        ).total_seconds()
+        if 0 < remaining < ttl:
+            # expire with the token so it is reported as expired
+            ttl = remaining
+        self._discard(token)
+        self._entries[token] = (now + ttl, user)
+        self._tokens_by_username[user["username"]] = token
+        while len(self._entries) > self.max_entries:
+            self._discard(next(iter(self._entries)))
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_by_username.clear()
+        self._generation += 1
+        self._invalidated.clear()
+        self._forgotten = self._generation
+
+    def invalidate_user(self, username):
+        self._generation += 1
+        self._invalidated[username] = self._generation
+        self._invalidated.move_to_end(username)
+        while len(self._invalidated) > self.max_entries:
+            _, self._forgotten = self._invalidated.popitem(last=False)
+        token = self._tokens_by_username.get(username)
+        if token is not None:
+            self._discard(token)
+
+    def _invalidated_since(self, username, generation):
+        return max(self._invalidated.get(username, 0), self._forgotten) > generation
+
+    def _discard(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            self._tokens_by_username.pop(entry[1]["username"], None)
+
+    async def lookup(self, token):
+        """
+        Get a user by play token, from the cache when possible.
+        A copy is returned so callers can't modify cached records.
+        """
+        user = self.get(token)
+        if user is not None:
+            metrics.play_token_lookups.inc(result="hit")
+            return dict(user)
+        metrics.play_token_lookups.inc(result="miss")
+        generation = self._generation
+        user = await db.users.select_by_play_token(token)
+        if user is None:
+            return None
+        if not self._invalidated_since(user["username"], generation):
+            self.put(token, user)
+        return dict(user)
+
+    async def listen_for_rotations(self, redis_host, retry_interval=5):
+        """
+        Drop cached entries for users whose token was rotated on any node,
+        reconnects whenever the connection to redis is lost
+        """
+        while True:
+            try:
+                await self._listen_for_rotations(redis_host)
+            except (aioredis.RedisError, OSError) as e:
+                print(f"[!] play token rotations unavailable: {e!r}")
+            else:
+                print("[!] play token rotations connection closed")
+            await asyncio.sleep(retry_interval)
+
+    async def _listen_for_rotations(self, redis_host):
+        conn = await aioredis.create_redis(f"redis://{redis_host}")
+        try:
+            (channel,) = await conn.subscribe(db.users.PLAY_TOKEN_ROTATED_CHANNEL)
+            # anything rotated before now may have been missed
+            self.clear()
+            while await channel.wait_message():
+                username = await channel.get(encoding="utf-8")
+                self.invalidate_user(username)
+        finally:
+            conn.close()
+            await conn.wait_closed()
+
+
+play_tokens = PlayTokenCache(
+    ttl=float(os.environ.get("PLAY_TOKEN_CACHE_TTL", 30)),
+    max_entries=int(os.environ.get("PLAY_TOKEN_CACHE_SIZE", 10000)),
+)